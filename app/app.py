@@ -1,10 +1,13 @@
 import os
-from flask import Flask, g, request, send_from_directory
+import json
+import click
+from flask import Flask, Response, g, request, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.utils import secure_filename
 from flask_restx import Api, Resource, fields, reqparse
 
-db = SQLAlchemy()
+from .routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
 ALLOWED_EXTENSIONS = set(['pdf', 'png', 'jpg', 'jpeg', 'gif'])
 
@@ -12,11 +15,55 @@ def create_app():
     app = Flask(__name__,
                 static_folder='../dist',
                 template_folder='../dist')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://admin:admin@db:5432/twitter_db'
-    #To prod postgresql://admin:admin@db:5432/twitter_db localhost
+    from . import db_config
+    db_config.configure(app)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+    app.config['SERVE_SOURCE_MAPS'] = os.environ.get('SERVE_SOURCE_MAPS', '1') == '1'
+    app.config['MEDIA_OFFLOAD'] = os.environ.get('MEDIA_OFFLOAD')
+    app.config['MEDIA_ACCEL_PREFIX'] = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+    app.config['USE_X_SENDFILE'] = app.config['MEDIA_OFFLOAD'] == 'x-sendfile'
+    app.config['MEDIA_WORKERS'] = int(os.environ.get('MEDIA_WORKERS', 2))
+    app.config['MEDIA_VARIANT_WIDTHS'] = (320, 640, 1280)
+    app.config['FEED_IMAGE_WIDTH'] = 640
+    app.config['FEED_PAGE_SIZE'] = 20
+    app.config['FEED_MAX_PAGE_SIZE'] = 100
+    app.config['FOLLOW_PAGE_SIZE'] = 50
+    app.config['FOLLOW_MAX_PAGE_SIZE'] = 200
+    app.config['TIMELINE_MODE'] = os.environ.get('TIMELINE_MODE', 'read')
+    app.config['TIMELINE_FANOUT_LIMIT'] = 10000
+    app.config['TIMELINE_BACKFILL'] = 200
+    app.config['AUTH_CACHE_SIZE'] = 10000
+    app.config['AUTH_CACHE_TTL'] = 300
+    app.config['TWEET_CACHE'] = os.environ.get('TWEET_CACHE', '0') == '1'
+    app.config['TWEET_CACHE_MAX_BYTES'] = int(os.environ.get('TWEET_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    app.config['TWEET_CACHE_TTL'] = 300
+    app.config['EVENTS_HEARTBEAT'] = 15
+    app.config['EVENTS_HISTORY'] = 1000
+    app.config['EVENTS_CLIENT_BUFFER'] = 100
+    app.config['EVENTS_MAX_STREAMS'] = int(os.environ.get('EVENTS_MAX_STREAMS', 0))
+    app.config['SYNC_MAX_CHANGES'] = 1000
+    app.config['FAST_SERIALIZATION'] = os.environ.get('FAST_SERIALIZATION', '1') == '1'
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+    app.config['LIKE_WRITE_BEHIND'] = os.environ.get('LIKE_WRITE_BEHIND', '0') == '1'
+    app.config['LIKE_FLUSH_INTERVAL'] = float(os.environ.get('LIKE_FLUSH_INTERVAL', 0.5))
+    app.config['LIKE_BUFFER_MAX'] = 10000
+    app.config['BATCH_MAX_SIZE'] = 100
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            db_config.instrument_engine(app, engine)
+    from .media import UploadRequest, store_upload, media_url, media_response
+    from .assets import AssetManifest, asset_response, compress_assets
+    app.request_class = UploadRequest
+    app.extensions['assets'] = AssetManifest(app.static_folder, app.config['SERVE_SOURCE_MAPS'])
+    from . import compression, instrumentation, metrics, routing
+    instrumentation.init_app(app)
+    metrics.init_app(app)
+    routing.init_app(app)
+    compression.init_app(app)
 
     api = Api(
         app,
@@ -35,6 +82,9 @@ def create_app():
             }
         }
     )
+    from .serialization import output_json, shape
+    api.representations['application/json'] = output_json
+    app.extensions['api'] = api
 
     user_model = api.model("User", {
         "id": fields.Integer,
@@ -44,8 +94,18 @@ def create_app():
     profile_model = api.model("Profile", {
         "id": fields.Integer,
         "name": fields.String,
-        "followers": fields.List(fields.Nested(user_model)),
-        "following": fields.List(fields.Nested(user_model)),
+        "followers_count": fields.Integer,
+        "following_count": fields.Integer,
+        "followers": fields.List(fields.Nested(user_model), description="First page, newest first"),
+        "following": fields.List(fields.Nested(user_model), description="First page, newest first"),
+        "followers_next_cursor": fields.String,
+        "following_next_cursor": fields.String,
+    })
+
+    follow_page_model = api.model("FollowPage", {
+        "result": fields.Boolean,
+        "users": fields.List(fields.Nested(user_model)),
+        "next_cursor": fields.String(description="Cursor of the next page, null on the last one"),
     })
 
     extended_profile_model = api.model("ExtendedProfile", {
@@ -65,12 +125,41 @@ def create_app():
                 "name": fields.String,
             }))),
         }))),
+        "next_cursor": fields.String(description="Cursor of the next page, null on the last one"),
+        "deleted": fields.List(fields.Integer, description="With since_id: ids of deleted tweets"),
+        "since_id": fields.Integer(description="Pass as since_id to get later changes only"),
+    })
+
+    like_state_model = api.model("LikeState", {
+        "tweet_id": fields.Integer,
+        "like_count": fields.Integer,
+    })
+
+    follow_state_model = api.model("FollowState", {
+        "user_id": fields.Integer,
+        "followers_count": fields.Integer,
+    })
+
+    media_status_model = api.model("MediaStatus", {
+        "result": fields.Boolean,
+        "media_id": fields.Integer,
+        "url": fields.String,
+        "status": fields.String(description="pending, ready, failed or skipped"),
+        "variants": fields.Raw(description="Variant urls by width"),
     })
 
     tweets_ns = api.namespace("tweets", description="Operations with tweets")
     users_ns = api.namespace("users", description="Operations with users")
     media_ns = api.namespace("medias", description="Just media")
 
+    page_parser = reqparse.RequestParser()
+    page_parser.add_argument("limit", type=int, location="args", help="Page size")
+    page_parser.add_argument("cursor", type=str, location="args", help="next_cursor of the previous page")
+
+    feed_parser = page_parser.copy()
+    feed_parser.add_argument("since_id", type=int, location="args",
+                             help="since_id of an earlier response; only changes after it")
+
     upload_parser = reqparse.RequestParser()
     upload_parser.add_argument("file", type=str, location="files", required=True, help="File required")
 
@@ -78,8 +167,18 @@ def create_app():
     api.add_namespace(users_ns)
     api.add_namespace(media_ns)
 
-    from .models import User, Tweet, Follow, Like, Attachment
-    from .utils import get_user_by_key, get_list_tweets, get_user_by_id
+    from sqlalchemy import select
+    from .models import Tweet, Follow, Attachment
+    from .utils import follow_users, get_user_by_key, unfollow_user, InvalidCursor
+    from .feed import get_feed_page
+    from .profiles import get_profile, follow_page
+    from .variants import get_variant_worker, pick_variant
+    from .cache import get_tweet_cache
+    from . import events, timeline
+    from .sync import (SyncExpired, changes_since, feed_version, make_etag, not_modified,
+                       profile_version, prune_changes, record_change, sync_horizon)
+    from .counters import recount
+    from .likebuffer import apply_intents, get_like_buffer
 
     def init_db():
         print("Инициализация базы данных")
@@ -97,6 +196,36 @@ def create_app():
             g._db_initialized = True
             print("База инициализирована.")
 
+    @app.cli.command("rebuild-timelines")
+    def rebuild_timelines():
+        """Пересобрать ленты пользователей по подпискам."""
+        timeline.rebuild_timelines()
+
+    @app.cli.command("compress-assets")
+    def compress_assets_command():
+        """Сжать файлы фронтенда (gzip, brotli) для отдачи без сжатия на лету."""
+        for path in compress_assets(app.static_folder):
+            print(path)
+
+    @app.cli.command("pool-status")
+    def pool_status_command():
+        """Показать состояние пула соединений."""
+        for bind, engine in db.engines.items():
+            print(bind or 'default', db_config.pool_status(engine))
+
+    @app.cli.command("recount")
+    @click.option("--batch-size", default=1000, show_default=True, help="Строк на транзакцию.")
+    def recount_command(batch_size):
+        """Пересчитать счётчики лайков и подписок."""
+        for counter, fixed in recount(batch_size).items():
+            print(f"{counter}: исправлено {fixed}")
+
+    @app.cli.command("prune-changes")
+    @click.option("--keep", default=1000000, show_default=True, help="Сколько последних изменений оставить.")
+    def prune_changes_command(keep):
+        """Удалить старые записи журнала изменений ленты."""
+        print(f"удалено {prune_changes(keep)}")
+
     @app.teardown_appcontext
     def shutdown_session(exception=None):
         db.session.remove()
@@ -105,18 +234,46 @@ def create_app():
     class TweetList(Resource):
         @tweets_ns.doc(security="Api-Key")
         @tweets_ns.response(401, "Api-Key not found")
-        @tweets_ns.marshal_list_with(tweet_model)
+        @tweets_ns.response(400, "Invalid cursor")
+        @tweets_ns.response(304, "Not modified since the ETag in If-None-Match")
+        @tweets_ns.response(410, "since_id is too old, reload the feed")
+        @tweets_ns.expect(feed_parser)
+        @tweets_ns.response(200, "Feed page", tweet_model)
         def get(self):
             api_key = request.headers.get('Api-Key')
             if not api_key:
                 api.abort(401, "Api-Key required")
             user = get_user_by_key(api_key)
+            args = feed_parser.parse_args()
+            limit = args['limit'] or app.config['FEED_PAGE_SIZE']
+            limit = max(1, min(limit, app.config['FEED_MAX_PAGE_SIZE']))
+            version = feed_version(user.id)
+            like_buffer = get_like_buffer()
+            pending = like_buffer.pending_for(user.id) if like_buffer else None
+            etag = make_etag('feed', user.id, version, limit, args['cursor'], args['since_id'],
+                             sorted(pending.items()) if pending else None)
+            if not_modified(etag):
+                return {}, 304, {'ETag': etag}
             try:
-                tweets = get_list_tweets(user)
-                return {"result": True, "tweets": tweets}
+                if args['since_id'] is not None:
+                    tweets, deleted, since_id = changes_since(user, args['since_id'])
+                    if like_buffer:
+                        tweets = like_buffer.overlay(user, tweets, pending)
+                    return (shape({"result": True, "tweets": tweets, "deleted": deleted, "since_id": since_id},
+                                  tweet_model), 200, {'ETag': etag})
+                since_id = sync_horizon(version[0])
+                tweets, next_cursor = get_feed_page(user, limit, args['cursor'])
+                if like_buffer:
+                    tweets = like_buffer.overlay(user, tweets, pending)
+                return (shape({"result": True, "tweets": tweets, "next_cursor": next_cursor,
+                               "since_id": since_id}, tweet_model), 200, {'ETag': etag})
+            except InvalidCursor:
+                api.abort(400, "Invalid cursor")
+            except SyncExpired:
+                api.abort(410, "since_id is too old, reload the feed")
             except Exception:
-                return {"result": False, "error_type": "db_error",
-                        "error_message": "Error in database"}
+                return shape({"result": False, "error_type": "db_error",
+                              "error_message": "Error in database"}, tweet_model)
 
         @tweets_ns.doc(security="Api-Key")
         @tweets_ns.expect(api.model("TweetCreate", {
@@ -134,6 +291,7 @@ def create_app():
                 author_id=user.id,
                 content=tweet_data['tweet_data']
             )
+            media_items = []
             if 'tweet_media_ids' in tweet_data:
                 media_items = Attachment.query.filter(Attachment.id.in_(tweet_data['tweet_media_ids'])).all()
                 tweet.attachments.extend(media_items)
@@ -142,12 +300,64 @@ def create_app():
                 for media in media_items:
                     media.tweet_id = tweet.id
                     db.session.add(media)
-                db.session.commit()
             else:
                 db.session.add(tweet)
-                db.session.commit()
+                db.session.flush()
+            timeline.on_tweet_created(tweet)
+            record_change('tweet', user.id, tweet.id)
+            db.session.commit()
+            assembled = {
+                "id": tweet.id,
+                "content": tweet.content,
+                "attachments": [pick_variant(media.url, media.variants, app.config['FEED_IMAGE_WIDTH'])
+                                for media in media_items],
+                "author": {"id": user.id, "name": user.name},
+                "likes": [],
+            }
+            tweet_cache = get_tweet_cache()
+            if tweet_cache is not None:
+                tweet_cache.set(tweet.id, assembled)
+            events.publish('tweet', user.id, assembled)
             return {"result": True, "tweet_id": tweet.id}, 201
 
+    @tweets_ns.route("/stream")
+    class TweetStream(Resource):
+        @tweets_ns.doc(security="Api-Key", description=(
+            "Server-sent events from followed users: tweet, like, unlike, delete. "
+            "Reconnect with Last-Event-ID to get missed events; "
+            "a reset event means the feed has to be reloaded."))
+        @tweets_ns.response(401, "Api-Key not found")
+        @tweets_ns.response(400, "Invalid Last-Event-ID")
+        @tweets_ns.response(404, "Streams are off")
+        @tweets_ns.response(503, "The worker has too many open streams")
+        def get(self):
+            api_key = request.headers.get('Api-Key')
+            if not api_key:
+                api.abort(401, "Api-Key required")
+            if not app.config['EVENTS_MAX_STREAMS']:
+                api.abort(404, "Streams are off")
+            user = get_user_by_key(api_key)
+            last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+            try:
+                last_event_id = int(last_event_id) if last_event_id else None
+            except ValueError:
+                api.abort(400, "Invalid Last-Event-ID")
+            authors = db.session.scalars(select(Follow.follow_on_id)
+                                         .where(Follow.follower_id == user.id)).all()
+            bus = events.get_event_bus()
+            try:
+                subscription, complete = bus.subscribe(user.id, authors, last_event_id)
+            except events.TooManyStreams:
+                return {"message": "Too many open streams, retry later"}, 503, {'Retry-After': '30'}
+            body = events.stream(bus, subscription, complete, app.config['EVENTS_HEARTBEAT'])
+            response = Response(body, mimetype='text/event-stream', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',
+            })
+            # The body's own cleanup never runs if the client leaves before it starts.
+            response.call_on_close(lambda: bus.unsubscribe(subscription))
+            return response
+
     @tweets_ns.route("/<int:tweet_id>")
     class TweetResource(Resource):
         @tweets_ns.doc(security="Api-Key")
@@ -161,8 +371,14 @@ def create_app():
             user = get_user_by_key(api_key)
             tweet = Tweet.query.get(tweet_id)
             if tweet and tweet.author_id == user.id:
+                timeline.on_tweet_deleted(tweet)
+                record_change('delete', user.id, tweet_id)
                 db.session.delete(tweet)
                 db.session.commit()
+                tweet_cache = get_tweet_cache()
+                if tweet_cache is not None:
+                    tweet_cache.invalidate(tweet_id)
+                events.publish('delete', user.id, {"tweet_id": tweet_id})
                 return {"result": True}, 204
             else:
                 api.abort(404, "Tweet not found")
@@ -172,6 +388,7 @@ def create_app():
         @media_ns.doc(security="Api-Key")
         @media_ns.response(401, "Api-Key not found")
         @media_ns.response(400, "File not allowed")
+        @media_ns.response(413, "File too large")
         @media_ns.expect(upload_parser)
         @media_ns.response(201, "Media uploaded", api.model("MediaUploadID", {"media_id": fields.Integer}))
         def post(self):
@@ -180,38 +397,63 @@ def create_app():
                 api.abort(401, "Api-Key required")
             file = request.files['file']
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                upload_dir = os.path.join(app.root_path, 'uploads')
-                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+                extension = file.filename.rsplit('.', 1)[1]
+                digest, path = store_upload(file, extension)
+                # The file is stored once per digest, but every upload gets its own
+                # row: attaching it to a tweet must not take it from another one.
                 media = Attachment(
-                    url=os.path.join(app.config['UPLOAD_FOLDER'], filename),
-                    src=file.filename
+                    url=media_url(path),
+                    src=file.filename,
+                    sha256=digest
                 )
+                done = Attachment.query.filter_by(sha256=digest, url=media.url, variants_status='ready').first()
+                if done is not None:
+                    media.variants, media.variants_status = done.variants, done.variants_status
                 db.session.add(media)
                 db.session.commit()
+                if done is None:
+                    get_variant_worker().submit(media.id)
                 return {"result": True, "media_id": media.id}, 201
             else:
                 api.abort(400, "File not allowed")
 
+    @media_ns.route("/<int:media_id>")
+    class MediaStatus(Resource):
+        @media_ns.doc(security="Api-Key")
+        @media_ns.response(401, "Api-Key not found")
+        @media_ns.response(404, "Media not found")
+        @media_ns.marshal_with(media_status_model)
+        def get(self, media_id):
+            api_key = request.headers.get('Api-Key')
+            if not api_key:
+                api.abort(401, "Api-Key required")
+            media = db.session.get(Attachment, media_id)
+            if not media:
+                api.abort(404, "Media not found")
+            return {
+                "result": True,
+                "media_id": media.id,
+                "url": media.url,
+                "status": media.variants_status,
+                "variants": json.loads(media.variants) if media.variants else {},
+            }
+
     @users_ns.route("/<int:user_id>/follow")
     class FollowResource(Resource):
         @users_ns.doc(security="Api-Key")
         @users_ns.response(401, "Api-Key not found")
-        @users_ns.response(201, "Follow created")
+        @users_ns.response(404, "User not found")
+        @users_ns.response(201, "Following the user",
+                           api.inherit("FollowResult", follow_state_model, {"result": fields.Boolean}))
         def post(self, user_id):
             api_key = request.headers.get('Api-Key')
             if not api_key:
                 api.abort(401, "Api-Key required")
             user = get_user_by_key(api_key)
-            follow = Follow(
-                follow_on_id=user_id,
-                follower_id=user.id
-            )
-            if follow:
-                db.session.add(follow)
-                db.session.commit()
-            return {"result": True}, 201
+            _, followers_counts = follow_users(user.id, [user_id])
+            if user_id not in followers_counts:
+                api.abort(404, "User not found")
+            return {"result": True, "user_id": user_id, "followers_count": followers_counts[user_id]}, 201
 
         @users_ns.doc(security="Api-Key")
         @users_ns.response(401, "Api-Key not found")
@@ -221,29 +463,29 @@ def create_app():
             if not api_key:
                 api.abort(401, "Api-Key required")
             user = get_user_by_key(api_key)
-            follow = Follow.query.filter_by(follow_on_id=user_id, follower_id=user.id).first()
-            if follow:
-                db.session.delete(follow)
-                db.session.commit()
+            unfollow_user(user.id, user_id)
             return {"result": True}, 204
 
     @tweets_ns.route("/<int:tweet_id>/likes")
     class LikeResource(Resource):
         @tweets_ns.doc(security="Api-Key")
         @tweets_ns.response(401, "Api-Key not found")
-        @tweets_ns.response(201, "Like created")
+        @tweets_ns.response(404, "Tweet not found")
+        @tweets_ns.response(201, "Tweet liked",
+                            api.inherit("LikeResult", like_state_model, {"result": fields.Boolean}))
         def post(self, tweet_id):
             api_key = request.headers.get('Api-Key')
             if not api_key:
                 api.abort(401, "Api-Key required")
             user = get_user_by_key(api_key)
-            like = Like(
-                user_id=user.id,
-                tweet_id=tweet_id
-            )
-            db.session.add(like)
-            db.session.commit()
-            return {"result": True}, 201
+            like_buffer = get_like_buffer()
+            if like_buffer:
+                like_counts = like_buffer.record(user, [tweet_id], True)
+            else:
+                _, like_counts = apply_intents([(user.id, tweet_id, True)], {user.id: user.name})
+            if tweet_id not in like_counts:
+                api.abort(404, "Tweet not found")
+            return {"result": True, "tweet_id": tweet_id, "like_count": like_counts[tweet_id]}, 201
 
         @tweets_ns.doc(security="Api-Key")
         @tweets_ns.response(401, "Api-Key not found")
@@ -253,80 +495,172 @@ def create_app():
             if not api_key:
                 return 401
             user = get_user_by_key(api_key)
-            like = Like.query.filter_by(user_id=user.id, tweet_id=tweet_id).first()
-            if like:
-                db.session.delete(like)
-                db.session.commit()
+            like_buffer = get_like_buffer()
+            if like_buffer:
+                like_buffer.record(user, [tweet_id], False)
+                return {"result": True}
+            apply_intents([(user.id, tweet_id, False)], {user.id: user.name})
             return {"result": True}
 
+    @tweets_ns.route("/likes:batch")
+    class LikeBatchResource(Resource):
+        @tweets_ns.doc(security="Api-Key")
+        @tweets_ns.expect(api.model("LikeBatch", {"tweet_ids": fields.List(fields.Integer, required=True)}))
+        @tweets_ns.response(401, "Api-Key not found")
+        @tweets_ns.response(400, "tweet_ids must be a list of ids")
+        @tweets_ns.response(201, "Tweets liked", api.model("LikeBatchResult", {
+            "result": fields.Boolean,
+            "likes": fields.List(fields.Nested(like_state_model)),
+            "not_found": fields.List(fields.Integer),
+        }))
+        def post(self):
+            api_key = request.headers.get('Api-Key')
+            if not api_key:
+                api.abort(401, "Api-Key required")
+            user = get_user_by_key(api_key)
+            tweet_ids = batch_ids('tweet_ids')
+            like_buffer = get_like_buffer()
+            if like_buffer:
+                like_counts = like_buffer.record(user, tweet_ids, True)
+            else:
+                _, like_counts = apply_intents([(user.id, tweet_id, True) for tweet_id in tweet_ids],
+                                               {user.id: user.name})
+            return {"result": True,
+                    "likes": [{"tweet_id": tweet_id, "like_count": like_counts[tweet_id]}
+                              for tweet_id in tweet_ids if tweet_id in like_counts],
+                    "not_found": [tweet_id for tweet_id in tweet_ids if tweet_id not in like_counts]}, 201
+
+    @users_ns.route("/follow:batch")
+    class FollowBatchResource(Resource):
+        @users_ns.doc(security="Api-Key")
+        @users_ns.expect(api.model("FollowBatch", {"user_ids": fields.List(fields.Integer, required=True)}))
+        @users_ns.response(401, "Api-Key not found")
+        @users_ns.response(400, "user_ids must be a list of ids")
+        @users_ns.response(201, "Following the users", api.model("FollowBatchResult", {
+            "result": fields.Boolean,
+            "follows": fields.List(fields.Nested(follow_state_model)),
+            "not_found": fields.List(fields.Integer),
+        }))
+        def post(self):
+            api_key = request.headers.get('Api-Key')
+            if not api_key:
+                api.abort(401, "Api-Key required")
+            user = get_user_by_key(api_key)
+            user_ids = batch_ids('user_ids')
+            _, followers_counts = follow_users(user.id, user_ids)
+            return {"result": True,
+                    "follows": [{"user_id": user_id, "followers_count": followers_counts[user_id]}
+                                for user_id in user_ids if user_id in followers_counts],
+                    "not_found": [user_id for user_id in user_ids if user_id not in followers_counts]}, 201
+
     @users_ns.route("/me")
     class UserMeResource(Resource):
         @users_ns.doc(security="Api-Key")
         @users_ns.response(401, "Api-Key not found")
-        @users_ns.marshal_with(extended_profile_model)
+        @users_ns.response(304, "Not modified since the ETag in If-None-Match")
+        @users_ns.response(200, "Profile", extended_profile_model)
         def get(self):
             api_key = request.headers.get('Api-Key')
             if not api_key:
                 return "No API key", 401
             user = get_user_by_key(api_key)
-            followers = Follow.query.filter_by(follower_id=user.id).all()
-            followings = Follow.query.filter_by(follow_on_id=user.id).all()
-            return {
+            etag = make_etag('profile', user.id, profile_version(user.id), app.config['FOLLOW_PAGE_SIZE'])
+            if not_modified(etag):
+                return {}, 304, {'ETag': etag}
+            return shape({
                 "result": True,
-                "user": {
-                    "id": user.id,
-                    "name": user.name,
-                    "followers": [{"id": following.follow_on_id, "name": get_user_by_id(following.follow_on_id).name}
-                                  for following in
-                                  followings],
-                    "following": [{"id": follower.follower_id, "name": get_user_by_id(follower.follower_id).name} for
-                                  follower in
-                                  followers],
-                }
-            }
+                "user": get_profile(user.id, app.config['FOLLOW_PAGE_SIZE']),
+            }, extended_profile_model), 200, {'ETag': etag}
 
     @users_ns.route("/<int:user_id>")
     class UserResource(Resource):
         @users_ns.doc(security="Api-Key")
         @users_ns.response(404, "User not found")
-        @users_ns.marshal_with(extended_profile_model)
+        @users_ns.response(304, "Not modified since the ETag in If-None-Match")
+        @users_ns.response(200, "Profile", extended_profile_model)
         def get(self, user_id):
-            user = User.query.get(user_id)
-            if not user:
+            version = profile_version(user_id)
+            if version is None:
                 api.abort(404, "User not found")
-            followers = Follow.query.filter_by(follower_id=user.id).all()
-            followings = Follow.query.filter_by(follow_on_id=user.id).all()
-            return {
-                "user": {
-                    "id": user.id,
-                    "name": user.name,
-                    "followers": [{"id": following.follow_on_id, "name": get_user_by_id(following.follow_on_id).name}
-                                  for following in
-                                  followings],
-                    "following": [{"id": follower.follower_id, "name": get_user_by_id(follower.follower_id).name} for
-                                  follower in
-                                  followers],
-                }
-            }
+            etag = make_etag('profile', user_id, version, app.config['FOLLOW_PAGE_SIZE'])
+            if not_modified(etag):
+                return {}, 304, {'ETag': etag}
+            return (shape({"user": get_profile(user_id, app.config['FOLLOW_PAGE_SIZE'])}, extended_profile_model),
+                    200, {'ETag': etag})
+
+    def batch_ids(field):
+        """Distinct ids from the JSON body's field, 400 unless 1..BATCH_MAX_SIZE integers."""
+        ids = (request.get_json(silent=True) or {}).get(field)
+        if (not isinstance(ids, list) or not 0 < len(ids) <= app.config['BATCH_MAX_SIZE']
+                or not all(type(value) is int for value in ids)):
+            api.abort(400, f"{field} must be a list of 1 to {app.config['BATCH_MAX_SIZE']} ids")
+        return list(dict.fromkeys(ids))
+
+    def follow_list(user_id, direction):
+        version = profile_version(user_id)
+        if version is None:
+            api.abort(404, "User not found")
+        args = page_parser.parse_args()
+        limit = args['limit'] or app.config['FOLLOW_PAGE_SIZE']
+        limit = max(1, min(limit, app.config['FOLLOW_MAX_PAGE_SIZE']))
+        etag = make_etag(direction, user_id, version, limit, args['cursor'])
+        if not_modified(etag):
+            return {}, 304, {'ETag': etag}
+        try:
+            users, next_cursor = follow_page(user_id, direction, limit, args['cursor'])
+        except InvalidCursor:
+            api.abort(400, "Invalid cursor")
+        return shape({"result": True, "users": users, "next_cursor": next_cursor}, follow_page_model), 200, {'ETag': etag}
+
+    @users_ns.route("/<int:user_id>/followers")
+    class FollowersResource(Resource):
+        @users_ns.response(404, "User not found")
+        @users_ns.response(400, "Invalid cursor")
+        @users_ns.response(304, "Not modified since the ETag in If-None-Match")
+        @users_ns.expect(page_parser)
+        @users_ns.response(200, "Page of users", follow_page_model)
+        def get(self, user_id):
+            return follow_list(user_id, 'followers')
+
+    @users_ns.route("/<int:user_id>/following")
+    class FollowingResource(Resource):
+        @users_ns.response(404, "User not found")
+        @users_ns.response(400, "Invalid cursor")
+        @users_ns.response(304, "Not modified since the ETag in If-None-Match")
+        @users_ns.expect(page_parser)
+        @users_ns.response(200, "Page of users", follow_page_model)
+        def get(self, user_id):
+            return follow_list(user_id, 'following')
+
+    def index_response():
+        asset = app.extensions['assets'].get('index.html')
+        if asset is None:
+            return send_from_directory(app.template_folder, 'index.html')
+        return asset_response(asset)
 
     @app.route('/')
     def index():
-        return send_from_directory(app.template_folder, 'index.html')
+        return index_response()
+
+    @app.route('/media/<name>')
+    def serve_media(name):
+        return media_response(name)
 
     @app.route('/<path:path>')
     def serve_static(path):
         if path.startswith('api/'):
             return None
         if "uploads" in path:
-            file_name = path.split('/')[-1]
+            file_name = path.split('uploads/', 1)[-1]
             if not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], file_name)):
                 return None
             else:
                 return send_from_directory(app.config['UPLOAD_FOLDER'], file_name)
-        if os.path.exists(os.path.join(app.static_folder, path)):
-            return send_from_directory(app.static_folder, path)
+        asset = app.extensions['assets'].get(path)
+        if asset is not None:
+            return asset_response(asset)
         else:
-            return send_from_directory(app.template_folder, 'index.html')
+            return index_response()
 
     return app
 
@@ -0,0 +1,99 @@
+"""Serving of the built SPA in dist/.
+
+The folder is scanned once at startup into a manifest, so requests do no
+filesystem lookups to find an asset. ``flask compress-assets`` writes
+.gz (and .br when the brotli package is installed) siblings at build
+time; they are picked by Accept-Encoding. Fingerprinted bundles such as
+``app.ee2cdef2.js`` are cached forever, everything else (index.html) is
+revalidated on every use.
+"""
+import gzip
+import mimetypes
+import os
+import re
+from collections import namedtuple
+
+from flask import abort, request, send_file
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{8}\.[a-z]+(\.map)?$')
+COMPRESSIBLE = ('.js', '.css', '.html', '.map', '.json', '.svg', '.ico', '.txt')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+Asset = namedtuple('Asset', ['path', 'mimetype', 'fingerprinted', 'encoded'])
+
+
+class AssetManifest:
+    def __init__(self, folder, source_maps=True):
+        self.folder = folder
+        self.assets = {}
+        self.hidden = set()
+        for root, _, files in os.walk(folder):
+            names = set(files)
+            for name in files:
+                if name.endswith(('.gz', '.br')):
+                    continue
+                path = os.path.join(root, name)
+                key = os.path.relpath(path, folder).replace(os.sep, '/')
+                if name.endswith('.map') and not source_maps:
+                    self.hidden.add(key)
+                    continue
+                encoded = {encoding: path + suffix
+                           for encoding, suffix in ENCODINGS if name + suffix in names}
+                mimetype = mimetypes.guess_type(name)[0] or \
+                    ('application/json' if name.endswith('.map') else 'application/octet-stream')
+                self.assets[key] = Asset(path, mimetype, bool(FINGERPRINTED.search(name)), encoded)
+
+    def get(self, key):
+        if key in self.hidden:
+            abort(404)
+        return self.assets.get(key)
+
+
+def asset_response(asset):
+    """send_file for an asset, using a precompressed copy the client accepts."""
+    path, encoding = asset.path, None
+    for candidate, _ in ENCODINGS:
+        if candidate in asset.encoded and request.accept_encodings[candidate]:
+            path, encoding = asset.encoded[candidate], candidate
+            break
+    response = send_file(path, mimetype=asset.mimetype, conditional=True,
+                         max_age=IMMUTABLE_MAX_AGE if asset.fingerprinted else 0)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if asset.encoded:
+        response.vary.add('Accept-Encoding')
+    if asset.fingerprinted:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def compress_assets(folder, level=9):
+    """Write .gz/.br siblings of compressible files that lack a fresh one."""
+    written = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as source:
+                data = source.read()
+            outputs = [('.gz', lambda: gzip.compress(data, level, mtime=0))]
+            if brotli is not None:
+                outputs.append(('.br', lambda: brotli.compress(data, quality=11)))
+            for suffix, compress in outputs:
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                with open(target, 'wb') as output:
+                    output.write(compress())
+                written.append(target)
+    return written
@@ -0,0 +1,263 @@
+"""Caches shared by the request handlers."""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app
+
+from .events import LocalBroker
+from .metrics import AUTH_CACHE_LOOKUPS, TWEET_CACHE_LOOKUPS
+
+AuthUser = namedtuple('AuthUser', ['id', 'name'])
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry time to live."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocalSharedCache:
+    """In-process stand-in for a shared key-value backend such as Redis.
+
+    A real backend needs the same three methods; values are plain tuples
+    so they can be serialized by any client.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.time():
+                return None
+            return item[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class AuthCache:
+    """api_key -> AuthUser, per worker with an optional shared second level.
+
+    Entries are keyed by a hash of the key, so no api key is kept or sent
+    around. invalidate() clears the shared level and publishes on the
+    channel (see TweetCache), which drops the entry from every worker's
+    local level; without a shared channel other workers keep it until the
+    TTL.
+    """
+
+    def __init__(self, maxsize, ttl, shared=None, channel=None):
+        self.local = LRUCache(maxsize, ttl)
+        self.shared = shared
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.channel = channel if channel is not None else LocalBroker()
+        self.channel.subscribe(self._on_message)
+
+    @staticmethod
+    def _shared_key(api_key):
+        return 'auth:' + hashlib.sha256(api_key.encode()).hexdigest()
+
+    def get(self, api_key):
+        key = self._shared_key(api_key)
+        user = self.local.get(key)
+        if user is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                user = AuthUser(*value)
+                self.local.set(key, user)
+        with self._lock:
+            if user is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        AUTH_CACHE_LOOKUPS.labels('miss' if user is None else 'hit').inc()
+        return user
+
+    def set(self, api_key, user):
+        user = AuthUser(user.id, user.name)
+        key = self._shared_key(api_key)
+        self.local.set(key, user)
+        if self.shared is not None:
+            self.shared.set(key, tuple(user), self.ttl)
+        return user
+
+    def invalidate(self, api_key):
+        key = self._shared_key(api_key)
+        if self.shared is not None:
+            self.shared.delete(key)
+        self.channel.publish({'type': 'invalidate_auth', 'key': key})
+
+    def _on_message(self, event_id, message):
+        if message.get('type') == 'invalidate_auth':
+            self.local.delete(message['key'])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.local),
+        }
+
+
+def get_auth_cache():
+    cache = current_app.extensions.get('auth_cache')
+    if cache is None:
+        cache = current_app.extensions['auth_cache'] = AuthCache(
+            current_app.config['AUTH_CACHE_SIZE'],
+            current_app.config['AUTH_CACHE_TTL'],
+            current_app.config.get('AUTH_CACHE_BACKEND'),
+            current_app.config.get('AUTH_CACHE_CHANNEL'),
+        )
+    return cache
+
+
+class TweetCache:
+    """tweet id -> assembled feed dict, LRU within max_bytes, per worker.
+
+    Entry sizes are the length of their JSON encoding, a proxy for the
+    memory they take. Writers call invalidate() after committing; the
+    channel (anything with publish/subscribe, such as events.LocalBroker
+    or a shared pub/sub backend) carries it to every worker's cache.
+    Without a shared channel other workers keep serving the old version
+    until the TTL, so the cache is only used when TWEET_CACHE_CHANNEL is
+    set or TWEET_CACHE is on (a single worker).
+
+    Readers pass the generation they started at to set_many(), and a
+    tweet invalidated since then is not stored, so a reader racing a
+    writer cannot put the old version back.
+    """
+
+    def __init__(self, max_bytes, ttl, channel=None, tracked=100000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.generation = 0
+        self.channel = channel if channel is not None else LocalBroker()
+        self._data = OrderedDict()
+        self._invalidated = OrderedDict()
+        self._tracked = tracked
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.channel.subscribe(self._on_message)
+
+    def get_many(self, tweet_ids):
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for tweet_id in tweet_ids:
+                item = self._data.get(tweet_id)
+                if item is None:
+                    continue
+                if item[2] < now:
+                    self._drop(tweet_id)
+                    continue
+                self._data.move_to_end(tweet_id)
+                found[tweet_id] = item[0]
+        TWEET_CACHE_LOOKUPS.labels('hit').inc(len(found))
+        TWEET_CACHE_LOOKUPS.labels('miss').inc(len(tweet_ids) - len(found))
+        return found
+
+    def set_many(self, tweets, generation=None):
+        """Store tweet dicts, skipping those invalidated after generation."""
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for tweet_id, tweet in tweets.items():
+                if generation is not None and self._invalidated.get(tweet_id, self._floor) > generation:
+                    continue
+                size = len(json.dumps(tweet))
+                if size > self.max_bytes:
+                    continue
+                self._drop(tweet_id)
+                self._data[tweet_id] = (tweet, size, expires)
+                self.size += size
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._data)))
+
+    def set(self, tweet_id, tweet):
+        self.set_many({tweet_id: tweet})
+
+    def invalidate(self, tweet_id):
+        self.channel.publish({'type': 'invalidate', 'tweet_id': tweet_id})
+
+    def _on_message(self, event_id, message):
+        if message.get('type') != 'invalidate':
+            return
+        tweet_id = message['tweet_id']
+        with self._lock:
+            self.generation += 1
+            self._invalidated[tweet_id] = self.generation
+            self._invalidated.move_to_end(tweet_id)
+            if len(self._invalidated) > self._tracked:
+                _, self._floor = self._invalidated.popitem(last=False)
+            self._drop(tweet_id)
+
+    def _drop(self, tweet_id):
+        item = self._data.pop(tweet_id, None)
+        if item is not None:
+            self.size -= item[1]
+
+    def __len__(self):
+        return len(self._data)
+
+
+def get_tweet_cache():
+    """The worker's TweetCache, or None when it is not enabled."""
+    if not current_app.config['TWEET_CACHE'] and current_app.config.get('TWEET_CACHE_CHANNEL') is None:
+        return None
+    cache = current_app.extensions.get('tweet_cache')
+    if cache is None:
+        cache = current_app.extensions['tweet_cache'] = TweetCache(
+            current_app.config['TWEET_CACHE_MAX_BYTES'],
+            current_app.config['TWEET_CACHE_TTL'],
+            current_app.config.get('TWEET_CACHE_CHANNEL'),
+        )
+    return cache
@@ -0,0 +1,100 @@
+"""On-the-fly compression of API responses.
+
+Responses with a mimetype in COMPRESS_MIMETYPES and a body of at least
+COMPRESS_MIN_SIZE bytes are encoded with brotli (when the package is
+installed) or gzip, whichever the client prefers in Accept-Encoding.
+Streamed bodies are compressed chunk by chunk with a sync flush after
+each one, so every chunk reaches the client when it is produced.
+
+Files (uploads, media, built assets) are never touched: they are sent
+with direct_passthrough and the assets have precompressed copies.
+Strong ETags become weak, since the encoded body differs byte for byte.
+"""
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+SKIPPED_PREFIXES = ('/uploads/', '/media/')
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def choose_encoding(app):
+    offered = ['br', 'gzip'] if brotli is not None and app.config['COMPRESS_BROTLI'] else ['gzip']
+    encoding = request.accept_encodings.best_match(offered)
+    return encoding if encoding in offered else None
+
+
+def compress_response(app, response):
+    if (response.mimetype not in app.config['COMPRESS_MIMETYPES']
+            or response.direct_passthrough
+            or request.method == 'HEAD'
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or request.path.startswith(SKIPPED_PREFIXES)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(app)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        if encoding == 'br':
+            body = _brotli_stream(response.response, app.config['COMPRESS_BROTLI_QUALITY'])
+        else:
+            body = _gzip_stream(response.response, app.config['COMPRESS_LEVEL'])
+        response.response = body
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        if encoding == 'br':
+            data = brotli.compress(data, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+        else:
+            data = gzip.compress(data, app.config['COMPRESS_LEVEL'], mtime=0)
+        response.set_data(data)
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_MIMETYPES', ('application/json',))
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BROTLI', True)
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+
+    @app.after_request
+    def compress(response):
+        return compress_response(app, response)
@@ -0,0 +1,107 @@
+"""Engine settings taken from the environment.
+
+DATABASE_URL             PostgreSQL url, or SQLite for development (docker-compose sets it)
+DB_POOL_SIZE             persistent connections per worker (5)
+DB_MAX_OVERFLOW          extra connections under load (10)
+DB_POOL_TIMEOUT          seconds to wait for a free connection (30)
+DB_POOL_RECYCLE          reconnect after this many seconds (1800)
+DB_POOL_PRE_PING         test connections on checkout, 1/0 (1)
+DB_STATEMENT_TIMEOUT_MS  PostgreSQL statement_timeout, 0 disables (0)
+DB_EXTERNAL_POOLER       1 behind PgBouncer in transaction mode (0)
+DATABASE_REPLICA_URLS    comma-separated read replicas (none)
+DB_REPLICA_STICKY_SECONDS  reads stay on the primary this long after a write (5)
+
+With an external pooler the app keeps no connections of its own
+(NullPool) and sets no session-level state: the statement timeout is
+applied with SET LOCAL at the start of every transaction instead of as
+a connection option.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+
+from .metrics import DB_POOL_CHECKED_OUT, DB_POOL_CONNECTIONS, TimedQueuePool
+
+DEFAULT_DATABASE_URL = 'postgresql://admin:admin@db:5432/twitter_db'
+
+
+def _flag(env, name, default):
+    return env.get(name, default) in ('1', 'true', 'yes', 'on')
+
+
+def database_url(env=os.environ):
+    return env.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+
+
+def replica_urls(env=os.environ):
+    return [url.strip() for url in env.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+
+
+def engine_options(url, env=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for url."""
+    if url.startswith('sqlite'):
+        # Flask-SQLAlchemy picks suitable pools for SQLite itself.
+        return {}
+    if _flag(env, 'DB_EXTERNAL_POOLER', '0'):
+        return {'poolclass': NullPool}
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(env.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(env.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(env.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(env.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _flag(env, 'DB_POOL_PRE_PING', '1'),
+    }
+    timeout = int(env.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if timeout and url.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout}'}
+    return options
+
+
+def configure(app, env=os.environ):
+    """Fill the engine config; call before db.init_app."""
+    url = database_url(env)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url, env)
+    binds = {
+        f'replica{i}': {'url': replica, **engine_options(replica, env)}
+        for i, replica in enumerate(replica_urls(env))
+    }
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.config['DB_REPLICAS'] = list(binds)
+    app.config['DB_REPLICA_STICKY_SECONDS'] = int(env.get('DB_REPLICA_STICKY_SECONDS', 5))
+    app.config['DB_EXTERNAL_POOLER'] = _flag(env, 'DB_EXTERNAL_POOLER', '0')
+    app.config['DB_STATEMENT_TIMEOUT_MS'] = int(env.get('DB_STATEMENT_TIMEOUT_MS', 0))
+
+
+def _set_local_timeout(timeout):
+    def begin(conn):
+        conn.exec_driver_sql(f'SET LOCAL statement_timeout = {timeout}')
+    return begin
+
+
+def _count(gauge, delta):
+    def listener(*args):
+        gauge.inc(delta)
+    return listener
+
+
+def instrument_engine(app, engine):
+    """Pool gauges and, behind an external pooler, per-transaction timeouts."""
+    event.listen(engine, 'checkout', _count(DB_POOL_CHECKED_OUT, 1))
+    event.listen(engine, 'checkin', _count(DB_POOL_CHECKED_OUT, -1))
+    event.listen(engine, 'connect', _count(DB_POOL_CONNECTIONS, 1))
+    event.listen(engine, 'close', _count(DB_POOL_CONNECTIONS, -1))
+    timeout = app.config['DB_STATEMENT_TIMEOUT_MS']
+    if timeout and app.config['DB_EXTERNAL_POOLER'] and engine.dialect.name == 'postgresql':
+        event.listen(engine, 'begin', _set_local_timeout(timeout))
+
+
+def pool_status(engine):
+    pool = engine.pool
+    status = {'class': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, name):
+            status[name] = getattr(pool, name)()
+    return status
@@ -0,0 +1,193 @@
+"""Live feed events for GET /api/tweets/stream.
+
+Handlers publish small deltas after their transaction commits:
+
+    tweet    {"id", "content", "attachments", "author", "likes"}, as in the feed
+    delete   {"tweet_id"}
+    like     {"tweet_id", "user_id", "name", "like_count"}
+    unlike   {"tweet_id", "user_id", "like_count"}
+
+Each open stream gets the events whose author the caller follows (or is).
+follow/unfollow events are not sent, they only update the author sets of
+the follower's open streams.
+
+Events go through a broker that numbers them and hands them to the
+EventBus of every worker. LocalBroker does this within one process; set
+EVENTS_BACKEND to an object with the same publish/subscribe methods
+(Redis pub/sub, for instance) to reach streams held by other workers.
+
+Every EventBus keeps the last EVENTS_HISTORY events, so a client that
+reconnects with Last-Event-ID gets what it missed; if that is no longer
+available it gets a ``reset`` event and should reload the feed. A stream
+holds at most EVENTS_CLIENT_BUFFER undelivered events; a client that
+falls further behind is disconnected and resumes the same way.
+
+An open stream holds its connection for as long as the client stays,
+which under gthread workers is a whole thread. Streams are therefore off
+unless EVENTS_MAX_STREAMS is set (404 otherwise); beyond that many per
+worker a client gets a 503. Set it with gevent workers, and with EVENTS_BACKEND unless
+there is a single worker: with LocalBroker a stream only sees events of
+its own worker, and event ids only mean something on that worker.
+"""
+import json
+import threading
+from collections import deque
+
+from flask import current_app
+
+
+class TooManyStreams(Exception):
+    """The worker already holds EventBus.max_streams subscriptions."""
+
+
+class LocalBroker:
+    """In-process stand-in for a shared pub/sub backend."""
+
+    def __init__(self):
+        self._listeners = []
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """callback(event_id, message) is called for every published message."""
+        self._listeners.append(callback)
+
+    def publish(self, message):
+        with self._lock:
+            self._last_id += 1
+            for callback in self._listeners:
+                callback(self._last_id, message)
+
+
+class Subscription:
+    """Events for one open stream, at most maxsize of them undelivered."""
+
+    def __init__(self, user_id, authors, maxsize):
+        self.user_id = user_id
+        self.authors = set(authors) | {user_id}
+        self.maxsize = maxsize
+        self.overflowed = False
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def wants(self, message):
+        if message['type'] in ('follow', 'unfollow'):
+            if message['follower_id'] == self.user_id:
+                if message['type'] == 'follow':
+                    self.authors.add(message['author_id'])
+                else:
+                    self.authors.discard(message['author_id'])
+            return False
+        return message['author_id'] in self.authors
+
+    def offer(self, event_id, message):
+        if not self.wants(message):
+            return
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self.overflowed = True
+            else:
+                self._items.append((event_id, message))
+            self._cond.notify()
+
+    def get(self, timeout):
+        """Next (event_id, message), or None after timeout or once overflowed."""
+        with self._cond:
+            if not self._items and not self.overflowed:
+                self._cond.wait(timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+
+class EventBus:
+    def __init__(self, history=1000, buffer=100, broker=None, max_streams=None):
+        self.buffer = buffer
+        self.max_streams = max_streams
+        self.broker = broker if broker is not None else LocalBroker()
+        self._history = deque(maxlen=history)
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self.broker.subscribe(self._deliver)
+
+    def _deliver(self, event_id, message):
+        with self._lock:
+            self._history.append((event_id, message))
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.offer(event_id, message)
+
+    def publish(self, kind, author_id, data=None, **fields):
+        self.broker.publish(dict(fields, type=kind, author_id=author_id, data=data))
+
+    def subscribe(self, user_id, authors, last_event_id=None):
+        """Open a subscription; returns (subscription, complete).
+
+        With last_event_id the missed events are queued first; complete
+        is False when some of them are no longer in the history. Raises
+        TooManyStreams at max_streams open subscriptions.
+        """
+        subscription = Subscription(user_id, authors, self.buffer)
+        complete = True
+        with self._lock:
+            if self.max_streams is not None and len(self._subscriptions) >= self.max_streams:
+                raise TooManyStreams()
+            if last_event_id is not None:
+                first_id = self._history[0][0] if self._history else None
+                last_id = self._history[-1][0] if self._history else 0
+                if last_event_id > last_id or (first_id is not None and first_id > last_event_id + 1):
+                    complete = False
+                else:
+                    for event_id, message in self._history:
+                        if event_id > last_event_id:
+                            subscription.offer(event_id, message)
+            self._subscriptions.add(subscription)
+        return subscription, complete
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+
+def get_event_bus():
+    bus = current_app.extensions.get('event_bus')
+    if bus is None:
+        bus = current_app.extensions['event_bus'] = EventBus(
+            current_app.config['EVENTS_HISTORY'],
+            current_app.config['EVENTS_CLIENT_BUFFER'],
+            current_app.config.get('EVENTS_BACKEND'),
+            current_app.config['EVENTS_MAX_STREAMS'],
+        )
+    return bus
+
+
+def publish(kind, author_id, data=None, **fields):
+    get_event_bus().publish(kind, author_id, data, **fields)
+
+
+def format_event(event_id, kind, data):
+    lines = [] if event_id is None else [f'id: {event_id}']
+    lines += [f'event: {kind}', 'data: ' + json.dumps(data, separators=(',', ':'))]
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream(bus, subscription, complete, heartbeat):
+    """SSE body: missed events or a reset, then live events and heartbeats."""
+    try:
+        yield 'retry: 3000\n\n'
+        if not complete:
+            yield format_event(None, 'reset', {})
+        while True:
+            item = subscription.get(heartbeat)
+            if item is not None:
+                event_id, message = item
+                yield format_event(event_id, message['type'], message['data'])
+            elif subscription.overflowed:
+                return
+            else:
+                yield ': heartbeat\n\n'
+    finally:
+        bus.unsubscribe(subscription)
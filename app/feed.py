@@ -0,0 +1,48 @@
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import joinedload
+
+from .app import db
+from .models import Follow, Tweet
+from .timeline import timeline_filter, timeline_mode
+from .utils import assemble_tweets, decode_cursor, encode_cursor
+
+
+def feed_filter(user):
+    """Tweets that go to the user's feed: by followed users and by the user."""
+    if timeline_mode() != 'read':
+        return timeline_filter(user)
+    followed = select(Follow.follow_on_id).where(Follow.follower_id == user.id)
+    return or_(Tweet.author_id.in_(followed), Tweet.author_id == user.id)
+
+
+def feed_query(user, cursor=None):
+    """Feed tweets ranked by like count, newest first on ties.
+
+    Ordering is (like_count DESC, id DESC), so a page boundary is fully
+    described by the last row's pair and the next page is a keyset
+    condition rather than an OFFSET.
+    """
+    like_count = Tweet.like_count
+    query = (select(Tweet)
+             .where(feed_filter(user))
+             .options(joinedload(Tweet.author))
+             .order_by(like_count.desc(), Tweet.id.desc()))
+    if cursor is not None:
+        last_count, last_id = cursor
+        query = query.where(or_(
+            like_count < last_count,
+            and_(like_count == last_count, Tweet.id < last_id),
+        ))
+    return query
+
+
+def get_feed_page(user, limit, cursor=None):
+    """Return (tweets, next_cursor) for one page of the user's feed."""
+    if cursor is not None:
+        cursor = decode_cursor(cursor, 2)
+    tweets = db.session.scalars(feed_query(user, cursor).limit(limit + 1)).all()
+    next_cursor = None
+    if len(tweets) > limit:
+        tweets = tweets[:limit]
+        next_cursor = encode_cursor(tweets[-1].like_count, tweets[-1].id)
+    return assemble_tweets(tweets), next_cursor
@@ -0,0 +1,86 @@
+"""Per-request SQL instrumentation.
+
+Engine events count the statements and DB time of the current request.
+With SQL_TIMING_HEADERS (always on in debug mode) responses carry
+X-Query-Count and Server-Timing; requests slower than SLOW_REQUEST_MS or
+running more than SLOW_REQUEST_QUERIES statements are logged with their
+slowest statements.
+"""
+import heapq
+import logging
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    def __init__(self, samples):
+        self.count = 0
+        self.total = 0.0
+        self.samples = samples
+        self.slowest = []
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total += duration
+        item = (duration, self.count, statement)
+        if len(self.slowest) < self.samples:
+            heapq.heappush(self.slowest, item)
+        else:
+            heapq.heappushpop(self.slowest, item)
+
+    def slowest_statements(self):
+        return [(duration, statement) for duration, _, statement in sorted(self.slowest, reverse=True)]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+    stats = g.get('query_stats') if has_app_context() else None
+    if stats is not None:
+        stats.record(statement, duration)
+
+
+def _listen():
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def init_app(app):
+    app.config.setdefault('SQL_TIMING_HEADERS', False)
+    app.config.setdefault('SLOW_REQUEST_MS', 500)
+    app.config.setdefault('SLOW_REQUEST_QUERIES', 20)
+    app.config.setdefault('SLOW_QUERY_SAMPLES', 3)
+    _listen()
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats(app.config['SLOW_QUERY_SAMPLES'])
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+        db_ms = stats.total * 1000
+        total_ms = (time.perf_counter() - g.request_start) * 1000
+        if app.debug or app.config['SQL_TIMING_HEADERS']:
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['Server-Timing'] = \
+                f'db;dur={db_ms:.1f};desc="{stats.count} queries", total;dur={total_ms:.1f}'
+        if total_ms > app.config['SLOW_REQUEST_MS'] or stats.count > app.config['SLOW_REQUEST_QUERIES']:
+            logger.warning(
+                "Slow request %s %s: %.1f ms, %d queries, %.1f ms in DB; slowest:%s",
+                request.method, request.path, total_ms, stats.count, db_ms,
+                ''.join(f'\n  {duration * 1000:.1f} ms {statement}'
+                        for duration, statement in stats.slowest_statements()))
+        return response
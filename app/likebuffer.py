@@ -0,0 +1,235 @@
+"""Write-behind likes (LIKE_WRITE_BEHIND=1).
+
+POST/DELETE /api/tweets/<id>/likes only record the intent: one upsert of
+the (user, tweet) row in like_intents, so the newest intent wins on
+whichever worker it arrived, and the request is answered once that
+commits. Every LIKE_FLUSH_INTERVAL seconds, or as soon as a worker took
+LIKE_BUFFER_MAX intents, a background thread claims all rows with
+DELETE ... RETURNING and applies them in the same transaction: a
+multi-row INSERT ... ON CONFLICT DO NOTHING for likes, a multi-row DELETE
+for unlikes, one counter UPDATE per tweet. Repeated intents change
+nothing. On PostgreSQL an advisory lock keeps it to one flush at a time;
+an intent written while its row is being claimed waits for that flush
+to commit and goes into the next one.
+
+Intents are in the database as soon as they are acknowledged, so a
+worker that stops or crashes loses none; any other worker applies them.
+The feed shows the caller's own intents on top of the likes.
+Without write-behind the handlers write through apply_intents directly.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import bindparam, delete, func, select, tuple_, update
+
+from . import events
+from .app import db
+from .cache import get_tweet_cache
+from .models import Like, LikeIntent, Tweet, User
+from .sync import record_change
+from .utils import dialect_insert, insert_ignoring_conflicts
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+FLUSH_LOCK_ID = 0x6c696b6573  # pg advisory lock key, 'likes'
+
+
+def _chunks(items):
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def apply_intents(intents, names):
+    """Write (user_id, tweet_id, liked) intents and commit.
+
+    names maps user_id -> name for the like events. Intents for tweets
+    that do not exist are dropped; the existing ones are key-share locked
+    so they cannot be deleted meanwhile. Rows and counters are written in
+    tweet_id order, so writers touching the same tweets do not deadlock.
+    Returns the (tweet_id, user_id, delta) of the likes actually added or
+    removed, and tweet_id -> like_count of the existing tweets.
+    """
+    tweet_ids = {tweet_id for _, tweet_id, _ in intents}
+    like_counts = dict(db.session.execute(
+        select(Tweet.id, Tweet.like_count).where(Tweet.id.in_(tweet_ids))
+        .order_by(Tweet.id).with_for_update(read=True, key_share=True)).all())
+    likes = sorted((tweet_id, user_id) for user_id, tweet_id, liked in intents
+                   if liked and tweet_id in like_counts)
+    unlikes = sorted((tweet_id, user_id) for user_id, tweet_id, liked in intents
+                     if not liked and tweet_id in like_counts)
+    changed = []
+    for pairs in _chunks(likes):
+        stmt = (insert_ignoring_conflicts(Like, ['tweet_id', 'user_id'])
+                .values([{'tweet_id': tweet_id, 'user_id': user_id} for tweet_id, user_id in pairs])
+                .returning(Like.tweet_id, Like.user_id))
+        changed += [(tweet_id, user_id, 1) for tweet_id, user_id in db.session.execute(stmt)]
+    for pairs in _chunks(unlikes):
+        stmt = (delete(Like).where(tuple_(Like.tweet_id, Like.user_id).in_(pairs))
+                .returning(Like.tweet_id, Like.user_id)
+                .execution_options(synchronize_session=False))
+        changed += [(tweet_id, user_id, -1) for tweet_id, user_id in db.session.execute(stmt)]
+    if not changed:
+        db.session.commit()
+        return changed, like_counts
+
+    deltas = Counter()
+    for tweet_id, _, delta in changed:
+        deltas[tweet_id] += delta
+    tweets = Tweet.__table__
+    counts = [{'b_id': tweet_id, 'b_delta': delta} for tweet_id, delta in sorted(deltas.items()) if delta]
+    if counts:
+        db.session.execute(update(tweets)
+                           .where(tweets.c.id == bindparam('b_id'))
+                           .values(like_count=tweets.c.like_count + bindparam('b_delta')), counts)
+    counted = {row.id: row for row in db.session.execute(
+        select(Tweet.id, Tweet.author_id, Tweet.like_count).where(Tweet.id.in_(deltas)))}
+    for tweet_id, delta in sorted(deltas.items()):
+        like_counts[tweet_id] = counted[tweet_id].like_count
+        record_change('like' if delta >= 0 else 'unlike', counted[tweet_id].author_id, tweet_id)
+    db.session.commit()
+
+    cache = get_tweet_cache()
+    if cache is not None:
+        for tweet_id in deltas:
+            cache.invalidate(tweet_id)
+    for tweet_id, user_id, delta in changed:
+        author_id, like_count = counted[tweet_id].author_id, counted[tweet_id].like_count
+        if delta > 0:
+            events.publish('like', author_id, {"tweet_id": tweet_id, "user_id": user_id,
+                                               "name": names[user_id], "like_count": like_count})
+        else:
+            events.publish('unlike', author_id, {"tweet_id": tweet_id, "user_id": user_id,
+                                                 "like_count": like_count})
+    return changed, like_counts
+
+
+def flush_intents():
+    """Claim the waiting intents and apply them; returns how many likes changed."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        if not db.session.scalar(select(func.pg_try_advisory_xact_lock(FLUSH_LOCK_ID))):
+            db.session.rollback()
+            return 0  # another worker is flushing
+    claimed = db.session.execute(
+        delete(LikeIntent).returning(LikeIntent.user_id, LikeIntent.tweet_id, LikeIntent.liked)
+        .execution_options(synchronize_session=False)).all()
+    if not claimed:
+        db.session.rollback()
+        return 0
+    names = dict(db.session.execute(
+        select(User.id, User.name).where(User.id.in_({user_id for user_id, _, _ in claimed}))).all())
+    changed, _ = apply_intents(claimed, names)
+    return len(changed)
+
+
+class LikeBuffer:
+    """Records like intents and flushes them from a background thread."""
+
+    def __init__(self, app, interval, max_pending=10000):
+        self.app = app
+        self.interval = interval
+        self.max_pending = max_pending
+        self._recorded = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        if interval > 0:
+            self._thread = threading.Thread(target=self._run, name='like-buffer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def record(self, user, tweet_ids, liked):
+        """Store the like (liked=True) or unlike by user of the existing tweet_ids.
+
+        Returns tweet_id -> like_count as the user sees it with the intent,
+        for the tweets that exist, like apply_intents.
+        """
+        like_counts = dict(db.session.execute(
+            select(Tweet.id, Tweet.like_count).where(Tweet.id.in_(tweet_ids))).all())
+        if not like_counts:
+            return like_counts
+        stored = set(db.session.scalars(
+            select(Like.tweet_id).where(Like.user_id == user.id, Like.tweet_id.in_(like_counts))))
+        stmt = dialect_insert(LikeIntent).values(
+            [{'user_id': user.id, 'tweet_id': tweet_id, 'liked': liked} for tweet_id in sorted(like_counts)])
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['user_id', 'tweet_id'],
+                                                      set_={'liked': stmt.excluded.liked}))
+        db.session.commit()
+        with self._lock:
+            self._recorded += len(like_counts)
+            full = self._recorded >= self.max_pending
+        if full:
+            self._wake.set()
+        return {tweet_id: like_count - (tweet_id in stored) + liked
+                for tweet_id, like_count in like_counts.items()}
+
+    def pending_for(self, user_id):
+        """tweet_id -> liked for the intents of user_id not yet applied."""
+        # From the primary: a replica may not have the intent yet.
+        return dict(db.session.execute(
+            select(LikeIntent.tweet_id, LikeIntent.liked).where(LikeIntent.user_id == user_id),
+            bind_arguments={'bind': db.engine}).all())
+
+    def overlay(self, user, tweets, pending=None):
+        """Feed tweets with the likes as the user will see them after the flush."""
+        if pending is None:
+            pending = self.pending_for(user.id)
+        if not pending:
+            return tweets
+        result = []
+        for tweet in tweets:
+            liked = pending.get(tweet['id'])
+            if liked is not None:
+                likes = [like for like in tweet['likes'] if like['user_id'] != user.id]
+                if liked:
+                    likes.append({"user_id": user.id, "name": user.name})
+                tweet = dict(tweet, likes=likes)
+            result.append(tweet)
+        return result
+
+    def flush(self):
+        """Apply the waiting intents of all workers; returns how many likes changed."""
+        with self._lock:
+            self._recorded = 0
+        with self.app.app_context():
+            try:
+                return flush_intents()
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Like flush failed, the intents stay for the next one")
+
+    def close(self):
+        """Stop the flush thread; waiting intents stay for the other workers."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            atexit.unregister(self.close)
+
+
+def get_like_buffer():
+    """The worker's LikeBuffer, or None unless LIKE_WRITE_BEHIND is on."""
+    if not current_app.config['LIKE_WRITE_BEHIND']:
+        return None
+    buffer = current_app.extensions.get('like_buffer')
+    if buffer is None:
+        buffer = current_app.extensions['like_buffer'] = LikeBuffer(
+            current_app._get_current_object(),
+            current_app.config['LIKE_FLUSH_INTERVAL'],
+            current_app.config['LIKE_BUFFER_MAX'],
+        )
+    return buffer
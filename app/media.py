@@ -0,0 +1,131 @@
+"""Streaming, content-addressed storage of uploaded media.
+
+Multipart file parts are written straight to a temp file next to the
+uploads (see UploadRequest), hashed while they stream in, and renamed into
+``<UPLOAD_FOLDER>/ab/cd/<sha256>.<ext>``. Identical files share one object.
+
+Objects never change, so they are served from the stable url
+``/media/<sha256>[_<width>].<ext>`` with the hash as a strong ETag and an
+immutable Cache-Control. MEDIA_OFFLOAD hands the bytes to a front proxy:
+``x-accel`` answers with X-Accel-Redirect to MEDIA_ACCEL_PREFIX + path,
+``x-sendfile`` with X-Sendfile.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+
+from flask import Request, Response, abort, current_app, request, send_file
+
+from .metrics import UPLOAD_BYTES
+
+CHUNK_SIZE = 64 * 1024
+MEDIA_NAME = re.compile(r'^(?P<digest>[0-9a-f]{64})(?:_\d+)?\.(?P<extension>[a-z0-9]+)$')
+MEDIA_MAX_AGE = 365 * 24 * 3600
+
+
+class HashingFile:
+    """Temp file that computes the SHA-256 of everything written to it."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-', delete=False)
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+        self.stored = False
+
+    @property
+    def name(self):
+        return self._file.name
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def store(self, path):
+        """Atomically move the file to path, or drop it if path already exists."""
+        self._file.close()
+        if os.path.exists(path):
+            os.unlink(self._file.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._file.name, path)
+        self.stored = True
+
+    def close(self):
+        self._file.close()
+        if not self.stored and os.path.exists(self._file.name):
+            os.unlink(self._file.name)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+def temp_folder():
+    # Inside the upload folder so that the final rename stays on one filesystem.
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'tmp')
+
+
+class UploadRequest(Request):
+    """Request that streams uploaded files to hashing temp files."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile(temp_folder())
+
+
+def media_path(digest, extension):
+    """Path of a stored object relative to the upload folder."""
+    return os.path.join(digest[:2], digest[2:4], f'{digest}.{extension}')
+
+
+def media_url(path):
+    """Stable public url of a stored object given its relative path."""
+    return '/media/' + os.path.basename(path)
+
+
+def store_upload(file, extension):
+    """Store an uploaded FileStorage, return (sha256, path relative to the upload folder)."""
+    stream = file.stream
+    if not isinstance(stream, HashingFile):
+        stream = HashingFile(temp_folder())
+        for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+            stream.write(chunk)
+    UPLOAD_BYTES.inc(stream.size)
+    digest = stream.hexdigest()
+    path = media_path(digest, extension)
+    try:
+        stream.store(os.path.join(current_app.config['UPLOAD_FOLDER'], path))
+    finally:
+        stream.close()
+    return digest, path
+
+
+def media_response(name):
+    """Response for /media/<name>: 304, proxy offload, or the (ranged) file."""
+    match = MEDIA_NAME.match(name)
+    if not match:
+        abort(404)
+    digest = match.group('digest')
+    etag = name.rsplit('.', 1)[0]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif current_app.config['MEDIA_OFFLOAD'] == 'x-accel':
+        path = os.path.join(digest[:2], digest[2:4], name)
+        response = Response(mimetype=mimetypes.guess_type(name)[0])
+        response.headers['X-Accel-Redirect'] = current_app.config['MEDIA_ACCEL_PREFIX'] + path
+    else:
+        path = os.path.join(current_app.config['UPLOAD_FOLDER'], digest[:2], digest[2:4], name)
+        try:
+            response = send_file(path, conditional=True, etag=etag, max_age=MEDIA_MAX_AGE)
+        except FileNotFoundError:
+            abort(404)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = MEDIA_MAX_AGE
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,89 @@
+"""Prometheus metrics, served at /metrics.
+
+Under gunicorn set PROMETHEUS_MULTIPROC_DIR to an empty directory shared
+by the workers (see gunicorn.conf.py); every worker then writes its
+samples there and /metrics aggregates all of them, whichever worker
+answers the scrape. Set it for the gunicorn process only: metrics are
+created on import, so any other process importing the app (alembic,
+flask commands) needs the directory to exist already.
+"""
+import os
+import time
+
+from flask import Response, current_app, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter,
+                               Gauge, Histogram, generate_latest, multiprocess)
+from sqlalchemy.pool import QueuePool
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by resource and method',
+    ['resource', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter(
+    'http_requests_total', 'Requests by resource, method and status',
+    ['resource', 'method', 'status'],
+)
+DB_POOL_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled DB connection',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    'db_pool_checked_out', 'DB connections currently in use', multiprocess_mode='livesum',
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Open DB connections', multiprocess_mode='livesum',
+)
+AUTH_CACHE_LOOKUPS = Counter(
+    'auth_cache_lookups_total', 'API key cache lookups', ['result'],
+)
+TWEET_CACHE_LOOKUPS = Counter(
+    'tweet_cache_lookups_total', 'Assembled tweet cache lookups', ['result'],
+)
+UPLOAD_BYTES = Counter(
+    'media_upload_bytes_total', 'Bytes received in media uploads',
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long checkouts wait for a free connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def resource_name():
+    """flask-restx resource class of the request, or the plain endpoint."""
+    view = current_app.view_functions.get(request.endpoint)
+    view_class = getattr(view, 'view_class', None)
+    return view_class.__name__ if view_class else (request.endpoint or 'unknown')
+
+
+def metrics_response():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.get('metrics_start')
+        if start is not None and request.endpoint != 'metrics':
+            resource = resource_name()
+            REQUEST_LATENCY.labels(resource, request.method).observe(time.perf_counter() - start)
+            REQUESTS.labels(resource, request.method, response.status_code).inc()
+        return response
+
+    app.add_url_rule('/metrics', 'metrics', metrics_response)
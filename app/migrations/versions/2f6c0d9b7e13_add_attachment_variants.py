@@ -0,0 +1,30 @@
+"""add attachment variants
+
+Revision ID: 2f6c0d9b7e13
+Revises: b81d3f4e6a20
+Create Date: 2026-10-18 13:02:48.116392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f6c0d9b7e13'
+down_revision: Union[str, Sequence[str], None] = 'b81d3f4e6a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('attachments', sa.Column('variants', sa.Text(), nullable=True))
+    op.add_column('attachments', sa.Column('variants_status', sa.String(length=16), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('attachments', 'variants_status')
+    op.drop_column('attachments', 'variants')
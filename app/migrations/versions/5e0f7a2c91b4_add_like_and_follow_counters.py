@@ -0,0 +1,35 @@
+"""add like and follow counters
+
+Revision ID: 5e0f7a2c91b4
+Revises: ccae3d847258
+Create Date: 2026-10-18 11:03:17.552904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e0f7a2c91b4'
+down_revision: Union[str, Sequence[str], None] = 'ccae3d847258'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tweets', sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('following_count', sa.Integer(), server_default='0', nullable=False))
+    # Existing rows start at 0; 'flask recount', which the container runs
+    # after the upgrade, fills them in small batches instead of rewriting
+    # whole tables here.
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'following_count')
+    op.drop_column('users', 'followers_count')
+    op.drop_column('tweets', 'like_count')
@@ -0,0 +1,75 @@
+"""stable media urls
+
+Revision ID: 7a4e19c05d6f
+Revises: 2f6c0d9b7e13
+Create Date: 2026-10-18 13:48:10.502771
+
+"""
+import json
+import os
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a4e19c05d6f'
+down_revision: Union[str, Sequence[str], None] = '2f6c0d9b7e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+attachments = sa.table('attachments',
+    sa.column('id', sa.Integer),
+    sa.column('url', sa.String),
+    sa.column('sha256', sa.String),
+    sa.column('variants', sa.Text),
+)
+
+
+# Where create_app keeps the uploads; the urls before this revision were
+# paths under it.
+UPLOAD_FOLDER = os.path.normpath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'uploads'))
+
+
+def upload_path(url):
+    """Path under UPLOAD_FOLDER that a /media/ url was rewritten from."""
+    name = os.path.basename(url)
+    return os.path.join(UPLOAD_FOLDER, name[:2], name[2:4], name)
+
+
+def upgrade() -> None:
+    """Point content-addressed attachments at /media/ urls."""
+    # The old paths keep working, so an offline (--sql) run leaves them.
+    if context.is_offline_mode():
+        return
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(attachments.c.id, attachments.c.url, attachments.c.variants)
+                              .where(attachments.c.sha256.isnot(None))).all()
+    for id, url, variants in rows:
+        values = {'url': '/media/' + os.path.basename(url)}
+        if variants:
+            values['variants'] = json.dumps({width: '/media/' + os.path.basename(variant)
+                                             for width, variant in json.loads(variants).items()})
+        connection.execute(attachments.update().where(attachments.c.id == id).values(**values))
+
+
+def downgrade() -> None:
+    """Point /media/ urls, including those of later uploads, back at upload paths."""
+    if context.is_offline_mode():
+        # '/media/' is 7 characters, the name starts with the hash. Variants
+        # need JSON rewriting, so they are dropped and the original is served.
+        folder = UPLOAD_FOLDER.replace("'", "''")
+        op.execute(f"UPDATE attachments SET url = '{folder}/' || substr(url, 8, 2) || '/' "
+                   "|| substr(url, 10, 2) || '/' || substr(url, 8), variants = NULL "
+                   "WHERE url LIKE '/media/%'")
+        return
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(attachments.c.id, attachments.c.url, attachments.c.variants)
+                              .where(attachments.c.url.like('/media/%'))).all()
+    for id, url, variants in rows:
+        values = {'url': upload_path(url)}
+        if variants:
+            values['variants'] = json.dumps({width: upload_path(variant)
+                                             for width, variant in json.loads(variants).items()})
+        connection.execute(attachments.update().where(attachments.c.id == id).values(**values))
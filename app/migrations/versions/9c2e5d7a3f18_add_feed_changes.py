@@ -0,0 +1,36 @@
+"""add feed changes
+
+Revision ID: 9c2e5d7a3f18
+Revises: d3a8c61f5b27
+Create Date: 2026-10-18 17:40:12.630915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2e5d7a3f18'
+down_revision: Union[str, Sequence[str], None] = 'd3a8c61f5b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('feed_changes',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('tweet_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=8), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_feed_changes_author_id', 'feed_changes', ['author_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_feed_changes_author_id', table_name='feed_changes')
+    op.drop_table('feed_changes')
@@ -0,0 +1,30 @@
+"""add attachment sha256
+
+Revision ID: b81d3f4e6a20
+Revises: 5e0f7a2c91b4
+Create Date: 2026-10-18 12:20:05.731660
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81d3f4e6a20'
+down_revision: Union[str, Sequence[str], None] = '5e0f7a2c91b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('attachments', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_attachments_sha256'), 'attachments', ['sha256'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_attachments_sha256'), table_name='attachments')
+    op.drop_column('attachments', 'sha256')
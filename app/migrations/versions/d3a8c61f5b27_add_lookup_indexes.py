@@ -0,0 +1,61 @@
+"""add lookup indexes
+
+Revision ID: d3a8c61f5b27
+Revises: 7a4e19c05d6f
+Create Date: 2026-10-18 16:21:37.118406
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a8c61f5b27'
+down_revision: Union[str, Sequence[str], None] = '7a4e19c05d6f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# likes.tweet_id is already the leading column of like_uc.
+INDEXES = [
+    ('ix_tweets_author_ranking', 'tweets', ['author_id', 'like_count', 'id']),
+    ('ix_follows_followers_page', 'follows', ['follow_on_id', 'id', 'follower_id']),
+    ('ix_follows_following_page', 'follows', ['follower_id', 'id', 'follow_on_id']),
+    ('ix_likes_user_tweet', 'likes', ['user_id', 'tweet_id']),
+    ('ix_attachments_tweet_id', 'attachments', ['tweet_id']),
+]
+
+
+def invalid_index(name):
+    """Whether name is an index left INVALID by a failed CONCURRENTLY build."""
+    if context.is_offline_mode():
+        return False
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return False
+    return bind.execute(sa.text(
+        "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+        "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"), {'name': name}).first() is not None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY cannot run inside a transaction. A failed or cancelled
+    # build leaves an INVALID index that if_not_exists would keep, so it is
+    # dropped first; a rerun then rebuilds it and skips the valid ones.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            if invalid_index(name):
+                op.drop_index(name, table_name=table,
+                              postgresql_concurrently=True, if_exists=True)
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,32 @@
+"""add feed change xid
+
+Revision ID: f2b7a9d4c6e1
+Revises: e61b0c4d8a37
+Create Date: 2026-10-20 09:41:08.552190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b7a9d4c6e1'
+down_revision: Union[str, Sequence[str], None] = 'e61b0c4d8a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Older changes keep a NULL xid: they are never returned by since_id
+    # and go with the next prune-changes.
+    op.add_column('feed_changes', sa.Column('xid', sa.BigInteger(), nullable=True))
+    op.create_index('ix_feed_changes_xid', 'feed_changes', ['xid'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_feed_changes_xid', table_name='feed_changes')
+    op.drop_column('feed_changes', 'xid')
@@ -6,6 +6,8 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     api_key = db.Column(db.String(100), unique=True)
     name = db.Column(db.String(100))
+    followers_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    following_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     following = db.relationship(
         'Follow',
@@ -32,10 +34,15 @@ class Tweet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     content = db.Column(db.Text)
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     attachments = db.relationship('Attachment', backref='tweet', cascade='all, delete-orphan')
     likes = db.relationship('Like', backref='tweet', cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_tweets_author_ranking', 'author_id', 'like_count', 'id'),
+    )
+
 
 class Follow(db.Model):
     __tablename__ = 'follows'
@@ -46,18 +53,21 @@ class Follow(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('follower_id', 'follow_on_id', name='follow_uc'),
+        db.Index('ix_follows_followers_page', 'follow_on_id', 'id', 'follower_id'),
+        db.Index('ix_follows_following_page', 'follower_id', 'id', 'follow_on_id'),
     )
 
 
 class Like(db.Model):
     __tablename__ = 'likes'
 
-    id = db.Column(db.BigInteger, primary_key=True)
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
     tweet_id = db.Column(db.Integer, db.ForeignKey('tweets.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
     __table_args__ = (
         db.UniqueConstraint('tweet_id', 'user_id', name='like_uc'),
+        db.Index('ix_likes_user_tweet', 'user_id', 'tweet_id'),
     )
 
 
@@ -65,6 +75,47 @@ class Attachment(db.Model):
     __tablename__ = 'attachments'
 
     id = db.Column(db.Integer, primary_key=True)
-    tweet_id = db.Column(db.Integer, db.ForeignKey('tweets.id'))
+    tweet_id = db.Column(db.Integer, db.ForeignKey('tweets.id'), index=True)
     url = db.Column(db.String(255))
-    src = db.Column(db.String(255))
\ No newline at end of file
+    src = db.Column(db.String(255))
+    sha256 = db.Column(db.String(64), index=True)
+    variants = db.Column(db.Text)
+    variants_status = db.Column(db.String(16), default='pending')
+
+class TimelineEntry(db.Model):
+    __tablename__ = 'timeline_entries'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    tweet_id = db.Column(db.Integer, db.ForeignKey('tweets.id'), primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_author', 'user_id', 'author_id'),
+        db.Index('ix_timeline_entries_tweet_id', 'tweet_id'),
+    )
+
+
+class FeedChange(db.Model):
+    """Append-only log of feed changes, the source of versions and deltas."""
+    __tablename__ = 'feed_changes'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    author_id = db.Column(db.Integer, nullable=False)
+    tweet_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(8), nullable=False)
+    # Writing transaction on PostgreSQL, the position since_id counts in.
+    xid = db.Column(db.BigInteger)
+
+    __table_args__ = (
+        db.Index('ix_feed_changes_author_id', 'author_id', 'id'),
+        db.Index('ix_feed_changes_xid', 'xid'),
+    )
+
+
+class LikeIntent(db.Model):
+    """Like or unlike not yet applied to likes, see likebuffer."""
+    __tablename__ = 'like_intents'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    tweet_id = db.Column(db.Integer, primary_key=True)
+    liked = db.Column(db.Boolean, nullable=False)
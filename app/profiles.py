@@ -0,0 +1,55 @@
+from sqlalchemy import select
+
+from .app import db
+from .models import Follow, User
+from .utils import decode_cursor, encode_cursor
+
+
+def follow_page_query(user_id, direction, limit):
+    """(Follow.id, user id, name) rows of one direction, newest follow first."""
+    if direction == 'followers':
+        own, other = Follow.follow_on_id, Follow.follower_id
+    else:
+        own, other = Follow.follower_id, Follow.follow_on_id
+    return (select(Follow.id, User.id, User.name)
+            .join(User, User.id == other)
+            .where(own == user_id)
+            .order_by(Follow.id.desc())
+            .limit(limit))
+
+
+def follow_page(user_id, direction, limit, cursor=None):
+    """One page of followers or followed users, newest follow first.
+
+    Returns (users, next_cursor); the cursor is the id of the last Follow
+    row, so each page is a single indexed range read joined with users.
+    """
+    query = follow_page_query(user_id, direction, limit + 1)
+    if cursor is not None:
+        last_follow_id, = decode_cursor(cursor, 1)
+        query = query.where(Follow.id < last_follow_id)
+    rows = db.session.execute(query).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][0])
+    return [{"id": user_id, "name": name} for _, user_id, name in rows], next_cursor
+
+
+def get_profile(user_id, limit):
+    """Profile with counters and the first page of both follow lists, or None."""
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    followers, followers_cursor = follow_page(user.id, 'followers', limit)
+    following, following_cursor = follow_page(user.id, 'following', limit)
+    return {
+        "id": user.id,
+        "name": user.name,
+        "followers_count": user.followers_count,
+        "following_count": user.following_count,
+        "followers": followers,
+        "following": following,
+        "followers_next_cursor": followers_cursor,
+        "following_next_cursor": following_cursor,
+    }
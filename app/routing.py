@@ -0,0 +1,120 @@
+"""Read-replica routing for db.session.
+
+SELECTs issued while handling a GET or HEAD request go to one of the
+replica binds listed in DB_REPLICAS; everything else (writes, flushes,
+CLI commands, other methods) goes to the primary. A request that writes
+anything, for instance auto-provisioning a user, stays on the primary
+for the rest of the request.
+
+Replicas lag behind the primary, so after a caller posts, likes or
+follows, their reads go to the primary for DB_REPLICA_STICKY_SECONDS.
+The write's response also sets the replica_sticky cookie, holding the
+time the stickiness ends, so whichever worker serves the next read sees
+it; a value further ahead than DB_REPLICA_STICKY_SECONDS is ignored.
+Callers that drop cookies still stay on the primary of the worker that
+took the write, and of every worker when AUTH_CACHE_BACKEND is set.
+"""
+import hashlib
+import random
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+
+from .cache import LRUCache
+
+READ_METHODS = ('GET', 'HEAD')
+STICKY_COOKIE = 'replica_sticky'
+
+
+class StickyWriters:
+    """api_key -> recently wrote, for read-your-writes."""
+
+    def __init__(self, ttl, maxsize=10000, shared=None):
+        self.local = LRUCache(maxsize, ttl)
+        self.shared = shared
+        self.ttl = ttl
+
+    @staticmethod
+    def _shared_key(api_key):
+        return 'sticky:' + hashlib.sha256(api_key.encode()).hexdigest()
+
+    def mark(self, api_key):
+        self.local.set(api_key, True)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(api_key), (1,), self.ttl)
+
+    def __contains__(self, api_key):
+        if self.local.get(api_key):
+            return True
+        if self.shared is not None and self.shared.get(self._shared_key(api_key)):
+            self.local.set(api_key, True)
+            return True
+        return False
+
+
+def get_sticky_writers():
+    sticky = current_app.extensions.get('replica_sticky')
+    if sticky is None:
+        sticky = current_app.extensions['replica_sticky'] = StickyWriters(
+            current_app.config['DB_REPLICA_STICKY_SECONDS'],
+            shared=current_app.config.get('AUTH_CACHE_BACKEND'),
+        )
+    return sticky
+
+
+def sticky_cookie():
+    """Whether the request carries a live replica_sticky cookie."""
+    try:
+        until = int(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return False
+    now = time.time()
+    return now < until <= now + current_app.config['DB_REPLICA_STICKY_SECONDS']
+
+
+def replica_bind():
+    """Bind key of the replica for this request's reads, or None for the primary."""
+    if not has_request_context() or request.method not in READ_METHODS:
+        return None
+    if 'db_replica' not in g:
+        replicas = current_app.config.get('DB_REPLICAS')
+        api_key = request.headers.get('Api-Key')
+        if not replicas or sticky_cookie() or (api_key and api_key in get_sticky_writers()):
+            g.db_replica = None
+        else:
+            g.db_replica = random.choice(replicas)
+    return g.db_replica
+
+
+def use_primary():
+    """Send the rest of this request to the primary."""
+    if has_request_context():
+        g.db_replica = None
+
+
+class RoutingSession(Session):
+    """Session that reads from a replica where replica_bind() allows it."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or (clause is not None and not getattr(clause, 'is_select', False)):
+                use_primary()
+            elif clause is not None:
+                key = replica_bind()
+                if key is not None:
+                    return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_app(app):
+    @app.after_request
+    def mark_writer(response):
+        api_key = request.headers.get('Api-Key')
+        if (app.config.get('DB_REPLICAS') and api_key
+                and request.method not in READ_METHODS and response.status_code < 400):
+            get_sticky_writers().mark(api_key)
+            ttl = app.config['DB_REPLICA_STICKY_SECONDS']
+            response.set_cookie(STICKY_COOKIE, str(int(time.time()) + ttl), max_age=ttl,
+                                httponly=True, samesite='Lax')
+        return response
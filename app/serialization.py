@@ -0,0 +1,43 @@
+"""Fast output path for the hot endpoints.
+
+The feed, profile and follow list builders return dicts already in the
+shape of their Swagger models, so with FAST_SERIALIZATION on the handlers
+only fill in missing top-level keys instead of running marshal over
+every nested tweet, like and user. The models stay on the handlers as
+documentation (``@ns.response(200, ..., model)``).
+
+API responses are encoded with orjson when it is installed, else with
+the stdlib json module as flask-restx does.
+"""
+import json
+
+from flask import current_app, make_response
+from flask_restx import marshal
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to json
+    orjson = None
+
+
+def shape(data, model):
+    """data in the model's shape: marshal, or only the top-level keys in fast mode."""
+    if current_app.config['FAST_SERIALIZATION']:
+        return {key: data.get(key) for key in model}
+    return marshal(data, model)
+
+
+def dumps(data):
+    if orjson is not None and not current_app.debug:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS) + b'\n'
+    settings = current_app.config.get('RESTX_JSON', {})
+    if current_app.debug:
+        settings = dict(settings, indent=4)
+    return (json.dumps(data, **settings) + '\n').encode()
+
+
+def output_json(data, code, headers=None):
+    """flask-restx representation for application/json."""
+    response = make_response(dumps(data), code)
+    response.headers.extend(headers or {})
+    return response
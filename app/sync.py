@@ -0,0 +1,164 @@
+"""Version tokens and delta sync for the feed and profiles.
+
+Every write that changes a feed (new tweet, deletion, like, unlike)
+appends a FeedChange row in the same transaction. A feed's version is
+the newest change id of the authors it shows, plus the id and number of
+the reader's follows, which changes on every follow and unfollow. All of
+it comes from index lookups, so an ETag can be checked and a 304 sent
+before the feed is built.
+
+Profiles are versioned by the user's name, counters and newest follow
+ids in both directions.
+
+With since_id the feed returns only what changed after that change id:
+tweets that are new or whose likes changed, in full, and the ids of
+deleted ones. Tweets of newly followed users are not included; clients
+reload the feed after following someone.
+
+since_id is a position in the change log, and a reader must never be
+handed one that a change still in flight can land behind. SQLite allows
+one writer at a time, so there the position is the change id. On
+PostgreSQL ids come from a sequence before commit and transactions
+commit in any order, so each change also stores the id of its
+transaction and that is the position. Every transaction below
+pg_snapshot_xmin(pg_current_snapshot()) has finished, so readers only
+go up to that horizon; later changes wait for the next call. Changes
+are queued on the session and inserted by the commit itself.
+"""
+import hashlib
+
+from flask import current_app, request
+from sqlalchemy import BigInteger, String, cast, delete, event, func, or_, select
+from sqlalchemy.orm import joinedload
+from werkzeug.http import quote_etag, unquote_etag
+
+from .app import db
+from .models import FeedChange, Follow, Tweet, User
+from .routing import RoutingSession
+from .utils import assemble_tweets
+
+
+class SyncExpired(Exception):
+    """since_id is older than the retained changes, or too much changed since."""
+
+
+def record_change(kind, author_id, tweet_id):
+    """Queue a FeedChange, inserted when the transaction commits."""
+    db.session.info.setdefault('feed_changes', []).append(
+        FeedChange(kind=kind, author_id=author_id, tweet_id=tweet_id))
+
+
+@event.listens_for(RoutingSession, 'before_commit')
+def insert_feed_changes(session):
+    changes = session.info.pop('feed_changes', None)
+    if not changes:
+        return
+    if session.get_bind().dialect.name == 'postgresql':
+        for change in changes:
+            change.xid = _as_bigint(func.pg_current_xact_id())
+    session.add_all(changes)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def drop_feed_changes(session):
+    session.info.pop('feed_changes', None)
+
+
+def _as_bigint(xid8):
+    return cast(cast(xid8, String), BigInteger)
+
+
+def _is_postgresql():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def change_position():
+    """The FeedChange column since_id counts in, see above."""
+    return FeedChange.xid if _is_postgresql() else FeedChange.id
+
+
+def sync_horizon(newest=None):
+    """since_id up to which every change is visible; read it before the changes.
+
+    On SQLite that is the newest change id, and newest (the feed's, from
+    feed_version) saves the query.
+    """
+    if _is_postgresql():
+        return db.session.scalar(select(_as_bigint(func.pg_snapshot_xmin(func.pg_current_snapshot())))) - 1
+    if newest is not None:
+        return newest
+    return db.session.scalar(select(func.max(FeedChange.id))) or 0
+
+
+def feed_version_query(user_id):
+    # One index probe per followed author for its newest change.
+    newest_of_author = (select(func.max(FeedChange.id))
+                        .where(FeedChange.author_id == Follow.follow_on_id)
+                        .scalar_subquery())
+    own = select(func.max(FeedChange.id)).where(FeedChange.author_id == user_id).scalar_subquery()
+    return (select(func.max(newest_of_author), func.max(Follow.id), func.count(Follow.id), own)
+            .where(Follow.follower_id == user_id))
+
+
+def feed_version(user_id):
+    """(newest change id, newest follow id, follow count) of the user's feed."""
+    followed, follow_id, follows, own_newest = db.session.execute(feed_version_query(user_id)).one()
+    return max(followed or 0, own_newest or 0), follow_id, follows
+
+
+def profile_version(user_id):
+    """Version of the user's profile and follow lists, None without the user."""
+    newest_follower = select(func.max(Follow.id)).where(Follow.follow_on_id == user_id).scalar_subquery()
+    newest_followed = select(func.max(Follow.id)).where(Follow.follower_id == user_id).scalar_subquery()
+    return db.session.execute(
+        select(User.name, User.followers_count, User.following_count, newest_follower, newest_followed)
+        .where(User.id == user_id)).first()
+
+
+def make_etag(*parts):
+    """Weak ETag for a response determined by parts."""
+    digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    return quote_etag(digest, weak=True)
+
+
+def not_modified(etag):
+    return request.if_none_match.contains_weak(unquote_etag(etag)[0])
+
+
+def changes_since(user, since_id):
+    """Return (tweets, deleted_ids, since_id) for changes after since_id."""
+    horizon = sync_horizon()
+    position = change_position()
+    oldest = db.session.scalar(select(func.min(position)))
+    if since_id > horizon or (oldest is not None and since_id < oldest - 1):
+        raise SyncExpired()
+    limit = current_app.config['SYNC_MAX_CHANGES']
+    followed = select(Follow.follow_on_id).where(Follow.follower_id == user.id)
+    rows = db.session.execute(
+        select(FeedChange.tweet_id, FeedChange.kind)
+        .where(position > since_id, position <= horizon)
+        .where(or_(FeedChange.author_id.in_(followed), FeedChange.author_id == user.id))
+        .order_by(position, FeedChange.id)
+        .limit(limit + 1)).all()
+    if len(rows) > limit:
+        raise SyncExpired()
+    deleted = {tweet_id for tweet_id, kind in rows if kind == 'delete'}
+    changed = {tweet_id for tweet_id, _ in rows} - deleted
+    tweets = []
+    if changed:
+        tweets = db.session.scalars(select(Tweet)
+                                    .where(Tweet.id.in_(changed))
+                                    .options(joinedload(Tweet.author))
+                                    .order_by(Tweet.like_count.desc(), Tweet.id.desc())).all()
+    return assemble_tweets(tweets), sorted(deleted), max(since_id, horizon)
+
+
+def prune_changes(keep):
+    """Delete all but the newest keep changes; returns the number deleted."""
+    position = change_position()
+    newest_pruned = db.session.scalar(select(position).order_by(position.desc()).offset(keep).limit(1))
+    if newest_pruned is None:
+        return 0
+    result = db.session.execute(delete(FeedChange).where(or_(position <= newest_pruned, position.is_(None))))
+    db.session.commit()
+    return result.rowcount
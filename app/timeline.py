@@ -0,0 +1,140 @@
+"""Materialized home timelines (fan-out-on-write).
+
+TIMELINE_MODE selects how the feed finds candidate tweets:
+
+* ``read``   - join follows with tweets on every request (default);
+* ``write``  - every new tweet is pushed into its followers' timelines,
+  the feed reads the caller's timeline only;
+* ``hybrid`` - like ``write``, but authors with more than
+  TIMELINE_FANOUT_LIMIT followers are not fanned out, their tweets are
+  merged in at read time. An author who drops back to the limit gets
+  their recent tweets copied into every follower's timeline, since those
+  posted while above it were never pushed. Going above the limit needs
+  nothing: the pushed entries stay and the rest is merged.
+
+The store is pluggable through TIMELINE_STORE; the default keeps the
+timelines in the ``timeline_entries`` table.
+"""
+from flask import current_app
+from sqlalchemy import delete, exists, insert, or_, select, true
+
+from .app import db
+from .models import Follow, TimelineEntry, Tweet, User
+
+
+class SqlTimelineStore:
+    """Timelines stored as (user_id, tweet_id) rows."""
+
+    def push(self, tweet):
+        """Add the tweet to the timeline of every follower of its author."""
+        followers = (select(Follow.follower_id, db.literal(tweet.id), db.literal(tweet.author_id))
+                     .where(Follow.follow_on_id == tweet.author_id))
+        db.session.execute(insert(TimelineEntry).from_select(
+            ['user_id', 'tweet_id', 'author_id'], followers))
+
+    def backfill(self, user_id, author_id, limit):
+        """Copy the author's latest tweets into the user's timeline."""
+        recent = (select(db.literal(user_id), Tweet.id, Tweet.author_id)
+                  .where(Tweet.author_id == author_id)
+                  .order_by(Tweet.id.desc())
+                  .limit(limit))
+        db.session.execute(insert(TimelineEntry).from_select(
+            ['user_id', 'tweet_id', 'author_id'], recent))
+
+    def backfill_followers(self, author_id, limit):
+        """Copy the author's latest tweets into every follower's timeline, skipping present ones."""
+        recent = (select(Tweet.id)
+                  .where(Tweet.author_id == author_id)
+                  .order_by(Tweet.id.desc())
+                  .limit(limit)
+                  .subquery())
+        missing = (select(Follow.follower_id, recent.c.id, db.literal(author_id))
+                   .join(recent, true())
+                   .where(Follow.follow_on_id == author_id)
+                   .where(~exists().where(TimelineEntry.user_id == Follow.follower_id,
+                                          TimelineEntry.tweet_id == recent.c.id)))
+        db.session.execute(insert(TimelineEntry).from_select(
+            ['user_id', 'tweet_id', 'author_id'], missing))
+
+    def prune(self, user_id, author_id):
+        db.session.execute(delete(TimelineEntry).where(
+            TimelineEntry.user_id == user_id, TimelineEntry.author_id == author_id))
+
+    def remove_tweet(self, tweet_id):
+        db.session.execute(delete(TimelineEntry).where(TimelineEntry.tweet_id == tweet_id))
+
+    def tweet_ids(self, user_id):
+        """Ids of the user's timeline, as a select or a list."""
+        return select(TimelineEntry.tweet_id).where(TimelineEntry.user_id == user_id)
+
+    def clear(self):
+        db.session.execute(delete(TimelineEntry))
+
+
+def get_store():
+    store = current_app.config.get('TIMELINE_STORE')
+    if store is None:
+        store = current_app.config['TIMELINE_STORE'] = SqlTimelineStore()
+    return store
+
+
+def timeline_mode():
+    return current_app.config.get('TIMELINE_MODE', 'read')
+
+
+def is_fanned_out(author_id):
+    """Whether the author's tweets are pushed to follower timelines."""
+    mode = timeline_mode()
+    if mode == 'write':
+        return True
+    if mode == 'hybrid':
+        followers = db.session.scalar(select(User.followers_count).where(User.id == author_id))
+        return (followers or 0) <= current_app.config['TIMELINE_FANOUT_LIMIT']
+    return False
+
+
+def on_tweet_created(tweet):
+    if is_fanned_out(tweet.author_id):
+        get_store().push(tweet)
+
+
+def on_tweet_deleted(tweet):
+    # Entries may be left from an earlier mode, so cleanup does not look at it.
+    get_store().remove_tweet(tweet.id)
+
+
+def on_follow(follower_id, author_id):
+    if is_fanned_out(author_id):
+        get_store().backfill(follower_id, author_id, current_app.config['TIMELINE_BACKFILL'])
+
+
+def on_unfollow(follower_id, author_id, followers):
+    """followers is the author's followers_count after the unfollow."""
+    get_store().prune(follower_id, author_id)
+    if timeline_mode() == 'hybrid' and followers == current_app.config['TIMELINE_FANOUT_LIMIT']:
+        get_store().backfill_followers(author_id, current_app.config['TIMELINE_BACKFILL'])
+
+
+def timeline_filter(user):
+    """Feed predicate over Tweet for the materialized modes."""
+    clauses = [Tweet.author_id == user.id, Tweet.id.in_(get_store().tweet_ids(user.id))]
+    if timeline_mode() == 'hybrid':
+        big_authors = (select(Follow.follow_on_id)
+                       .join(User, User.id == Follow.follow_on_id)
+                       .where(Follow.follower_id == user.id)
+                       .where(User.followers_count > current_app.config['TIMELINE_FANOUT_LIMIT']))
+        clauses.append(Tweet.author_id.in_(big_authors))
+    return or_(*clauses)
+
+
+def rebuild_timelines():
+    """Recreate all timelines from follows, e.g. after switching modes."""
+    store = get_store()
+    store.clear()
+    fanned_out = {}
+    for follower_id, author_id in db.session.execute(select(Follow.follower_id, Follow.follow_on_id)):
+        if author_id not in fanned_out:
+            fanned_out[author_id] = is_fanned_out(author_id)
+        if fanned_out[author_id]:
+            store.backfill(follower_id, author_id, current_app.config['TIMELINE_BACKFILL'])
+    db.session.commit()
@@ -1,47 +1,243 @@
+import base64
+import binascii
+import json
+from collections import defaultdict
+
+from flask import current_app, has_app_context
+from sqlalchemy import String, bindparam, cast, delete, event, func, inspect, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import events, timeline
 from .app import db
-from .models import User, Tweet, Like, Attachment
+from .cache import AuthUser, get_auth_cache, get_tweet_cache
+from .counters import adjust_follow_counts
+from .models import User, Follow, Like, Attachment
+from .routing import RoutingSession, replica_bind
+from .variants import pick_variant
+
+def dialect_insert(model):
+    """INSERT of the session's dialect, with on_conflict_*.
+
+    The writes rely on ON CONFLICT, so PostgreSQL, or SQLite for
+    development and tests, is required.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model)
+    if dialect == 'sqlite':
+        return sqlite.insert(model)
+    raise NotImplementedError(f'ON CONFLICT is not supported on {dialect}')
+
+def insert_ignoring_conflicts(model, index_elements):
+    """INSERT ... ON CONFLICT (index_elements) DO NOTHING."""
+    return dialect_insert(model).on_conflict_do_nothing(index_elements=index_elements)
+
+def follow_users(follower_id, user_ids):
+    """Follow user_ids in one transaction; existing follows are left alone.
+
+    Returns the ids followed now and user_id -> followers_count of the
+    users that exist.
+    """
+    existing = set(db.session.scalars(select(User.id).where(User.id.in_(user_ids))))
+    followed = []
+    if existing:
+        stmt = (insert_ignoring_conflicts(Follow, ['follower_id', 'follow_on_id'])
+                .values([{'follower_id': follower_id, 'follow_on_id': user_id} for user_id in sorted(existing)])
+                .returning(Follow.follow_on_id))
+        followed = list(db.session.scalars(stmt))
+    if followed:
+        users = User.__table__
+        db.session.execute(update(users)
+                           .where(users.c.id == bindparam('b_id'))
+                           .values(followers_count=users.c.followers_count + 1),
+                           [{'b_id': user_id} for user_id in followed])
+        db.session.execute(update(User)
+                           .where(User.id == follower_id)
+                           .values(following_count=User.following_count + len(followed)))
+        for user_id in followed:
+            timeline.on_follow(follower_id, user_id)
+    followers_counts = dict(db.session.execute(
+        select(User.id, User.followers_count).where(User.id.in_(existing))).all())
+    db.session.commit()
+    for user_id in followed:
+        events.publish('follow', user_id, follower_id=follower_id)
+    return followed, followers_counts
+
+
+def unfollow_user(follower_id, user_id):
+    """Drop the follow and its counts in one transaction; True if there was one.
+
+    DELETE ... RETURNING decides which of racing unfollows removed the
+    row, and only that one adjusts the counters.
+    """
+    deleted = db.session.scalar(
+        delete(Follow).where(Follow.follower_id == follower_id, Follow.follow_on_id == user_id)
+        .returning(Follow.id).execution_options(synchronize_session=False))
+    if deleted is None:
+        db.session.commit()
+        return False
+    followers = adjust_follow_counts(follower_id, user_id, -1)
+    timeline.on_unfollow(follower_id, user_id, followers)
+    db.session.commit()
+    events.publish('unfollow', user_id, follower_id=follower_id)
+    return True
+
+def provision_user(api_key):
+    """Create the user of an unknown key, or return the one a concurrent request created.
+
+    A single INSERT ... ON CONFLICT DO NOTHING RETURNING; the name is taken
+    from the generated id, so nothing has to scan for the last user.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        new_id = select(func.nextval(func.pg_get_serial_sequence('users', 'id')).label('id')).subquery()
+        stmt = (postgresql.insert(User)
+                .from_select(['id', 'api_key', 'name'],
+                             select(new_id.c.id, literal(api_key),
+                                    literal('User@') + cast(new_id.c.id, String)))
+                .on_conflict_do_nothing(index_elements=['api_key'])
+                .returning(User.id, User.name))
+        row = db.session.execute(stmt).first()
+    else:
+        stmt = (insert_ignoring_conflicts(User, ['api_key'])
+                .values(api_key=api_key)
+                .returning(User.id))
+        row = db.session.execute(stmt).first()
+        if row:
+            name = f'User@{row.id}'
+            db.session.execute(update(User).where(User.id == row.id).values(name=name))
+            row = (row.id, name)
+    db.session.commit()
+    if row is None:
+        row = db.session.execute(select(User.id, User.name).where(User.api_key == api_key)).one()
+    return AuthUser(*row)
 
 def get_user_by_key(api_key):
+    """Return the AuthUser (id, name) of the key, creating the user if needed."""
+    cache = get_auth_cache()
+    cached = cache.get(api_key)
+    if cached:
+        return cached
     user = User.query.filter_by(api_key=api_key).first()
-    if user:
-        return user
-    else:
-        last_user = User.query.order_by(User.id.desc()).first()
-        if last_user:
-            user = User(
-                api_key=api_key,
-                name=f'User@{last_user.id + 1}',
-            )
-        else:
-            user = User(
-                api_key=api_key,
-                name='User@1',
-            )
-        db.session.add(user)
-        db.session.commit()
-        return user
+    if user is None:
+        user = provision_user(api_key)
+    return cache.set(api_key, user)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def queue_auth_invalidation(mapper, connection, target):
+    # Dropped only once committed, so the entry cannot be refilled with the old row.
+    state = inspect(target)
+    if state.session is None:
+        return
+    state.session.info.setdefault('auth_invalidations', set()).update(
+        api_key for api_key in [target.api_key, *state.attrs.api_key.history.deleted] if api_key)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def invalidate_auth_cache(session):
+    api_keys = session.info.pop('auth_invalidations', None)
+    if not api_keys or not has_app_context():
+        return
+    cache = get_auth_cache()
+    for api_key in api_keys:
+        cache.invalidate(api_key)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def drop_auth_invalidations(session):
+    session.info.pop('auth_invalidations', None)
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(*values):
+    """Opaque page cursor holding the sort key of the last returned row."""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != size \
+            or not all(type(value) is int for value in values):
+        raise InvalidCursor(cursor)
+    return values
 
 def get_user_by_id(user_id):
     return User.query.get(user_id)
 
 def get_likes(tweet_id):
-    likes = Like.query.filter_by(tweet_id=tweet_id).all()
-    return [{"user_id": like.user_id, "name": get_user_by_id(like.user_id).name} for like in likes]
+    return get_likes_by_tweet([tweet_id])[tweet_id]
 
 def get_attachments(tweet_id):
-    attachments = Attachment.query.filter_by(tweet_id=tweet_id).all()
-    return [attachment.url for attachment in attachments]
-
-def get_list_tweets(user):
-    tweets = Tweet.query.all()
-    return [
-        {"id": tweet.id,
-         "content": tweet.content,
-         "attachments": get_attachments(tweet.id),
-         "author": {
-             "id": tweet.author_id,
-             "name": tweet.author.name
-            },
-         "likes": get_likes(tweet.id)
-         }
-        for tweet in tweets]
+    return get_attachments_by_tweet([tweet_id])[tweet_id]
+
+def likes_query(tweet_ids):
+    return (db.session.query(Like.tweet_id, Like.user_id, User.name)
+            .join(User, User.id == Like.user_id)
+            .filter(Like.tweet_id.in_(tweet_ids))
+            .order_by(Like.id))
+
+def attachments_query(tweet_ids):
+    return (db.session.query(Attachment.tweet_id, Attachment.url, Attachment.variants)
+            .filter(Attachment.tweet_id.in_(tweet_ids))
+            .order_by(Attachment.id))
+
+def get_likes_by_tweet(tweet_ids):
+    """Likes of several tweets with liker names, in one query."""
+    likes = defaultdict(list)
+    if not tweet_ids:
+        return likes
+    rows = likes_query(tweet_ids).all()
+    for tweet_id, user_id, name in rows:
+        likes[tweet_id].append({"user_id": user_id, "name": name})
+    return likes
+
+def get_attachments_by_tweet(tweet_ids):
+    """Attachment urls of several tweets, in one query, preferring feed-sized variants."""
+    attachments = defaultdict(list)
+    if not tweet_ids:
+        return attachments
+    rows = attachments_query(tweet_ids).all()
+    width = current_app.config['FEED_IMAGE_WIDTH']
+    for tweet_id, url, variants in rows:
+        attachments[tweet_id].append(pick_variant(url, variants, width))
+    return attachments
+
+def assemble_tweets(tweets):
+    """Build feed dicts for already loaded tweets.
+
+    Authors must be eager loaded with the tweets. Dicts come from the
+    hot-tweet cache where possible; for the rest attachments and likes
+    are fetched with one IN-query each, so the number of queries does not
+    depend on the number of tweets or likes. Dicts read from a replica
+    may be behind the primary and are not cached.
+    """
+    cache = get_tweet_cache()
+    generation = cache.generation if cache is not None else None
+    assembled = cache.get_many([tweet.id for tweet in tweets]) if cache is not None else {}
+    missing = [tweet for tweet in tweets if tweet.id not in assembled]
+    if missing:
+        tweet_ids = [tweet.id for tweet in missing]
+        attachments = get_attachments_by_tweet(tweet_ids)
+        likes = get_likes_by_tweet(tweet_ids)
+        loaded = {
+            tweet.id: {
+                "id": tweet.id,
+                "content": tweet.content,
+                "attachments": attachments[tweet.id],
+                "author": {
+                    "id": tweet.author_id,
+                    "name": tweet.author.name
+                },
+                "likes": likes[tweet.id]
+            }
+            for tweet in missing}
+        if cache is not None and replica_bind() is None:
+            cache.set_many(loaded, generation)
+        assembled.update(loaded)
+    return [assembled[tweet.id] for tweet in tweets]
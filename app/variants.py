@@ -0,0 +1,161 @@
+"""Background generation of resized, metadata-free image variants.
+
+After an upload commits, its attachment id is queued to a thread pool
+(MEDIA_WORKERS threads; 0 runs jobs inline). A job writes one re-encoded
+copy per width in MEDIA_VARIANT_WIDTHS that is smaller than the original,
+plus a full-size copy, all without EXIF and other metadata, next to the
+original as ``<sha256>_<width>.<ext>``. The EXIF orientation is applied
+to the pixels first, since the copies lose the tag. Animated images are
+skipped: a copy would keep only the first frame. Attachment.variants_status
+tells clients when they are ready.
+
+Under the gevent worker the pool threads are greenlets, and decoding or
+resizing would stall every connection of the worker. There the Pillow
+work runs on gevent's pool of native threads; the job's greenlet waits
+for it and keeps the database work.
+"""
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import current_app
+
+from .app import db
+from .cache import get_tweet_cache
+from .media import media_path, media_url
+from .models import Attachment
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, without it variants are skipped
+    Image = None
+
+try:
+    from gevent import get_hub, monkey
+except ImportError:  # gevent is only needed for the gevent worker
+    monkey = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG', 'gif': 'GIF'}
+
+
+def variant_path(digest, extension, width):
+    return media_path(digest, extension).replace(f'{digest}.', f'{digest}_{width}.')
+
+
+def render_variants(folder, digest, extension, widths):
+    """Write the variants of a stored image; width -> url, or None if it is animated."""
+    with Image.open(os.path.join(folder, media_path(digest, extension))) as original:
+        if getattr(original, 'is_animated', False):
+            return None
+        image = ImageOps.exif_transpose(original)
+        variants = {}
+        for width in [width for width in widths if width < image.width] + [image.width]:
+            path = variant_path(digest, extension, width)
+            target = os.path.join(folder, path)
+            if not os.path.exists(target):
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize((width, height))
+                # Written without exif/info, so the copy carries no metadata.
+                tmp = f'{target}.{threading.get_ident()}.tmp'
+                resized.save(tmp, IMAGE_FORMATS[extension])
+                os.replace(tmp, target)
+            variants[width] = media_url(path)
+    return variants
+
+
+def run_cpu_bound(function, *args):
+    """Call function, on a native thread if gevent has patched threading."""
+    if monkey is not None and monkey.is_module_patched('threading'):
+        return get_hub().threadpool.apply(function, args)
+    return function(*args)
+
+
+def generate_variants(attachment_id):
+    media = db.session.get(Attachment, attachment_id)
+    if media is None:
+        return
+    extension = media.url.rsplit('.', 1)[-1].lower()
+    if Image is None or media.sha256 is None or extension not in IMAGE_FORMATS:
+        media.variants_status = 'skipped'
+        db.session.commit()
+        return
+    try:
+        variants = run_cpu_bound(render_variants, current_app.config['UPLOAD_FOLDER'], media.sha256,
+                                 extension, current_app.config['MEDIA_VARIANT_WIDTHS'])
+    except (OSError, ValueError):
+        logger.exception("Variant generation failed for attachment %s", attachment_id)
+        media.variants_status = 'failed'
+    else:
+        if variants is None:
+            media.variants_status = 'skipped'
+            db.session.commit()
+            return
+        media.variants = json.dumps(variants)
+        media.variants_status = 'ready'
+    db.session.commit()
+    if media.tweet_id is not None:
+        # The feed shows a variant now instead of the original.
+        tweet_cache = get_tweet_cache()
+        if tweet_cache is not None:
+            tweet_cache.invalidate(media.tweet_id)
+
+
+class VariantWorker:
+    """Local job queue in front of a thread pool."""
+
+    def __init__(self, app, workers):
+        self.app = app
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='variants') if workers else None
+        self.pending = set()
+        self._lock = threading.Lock()
+
+    def _run(self, attachment_id):
+        with self.app.app_context():
+            try:
+                generate_variants(attachment_id)
+            finally:
+                db.session.remove()
+
+    def submit(self, attachment_id):
+        if self.executor is None:
+            self._run(attachment_id)
+            return
+        future = self.executor.submit(self._run, attachment_id)
+        with self._lock:
+            self.pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self.pending.discard(future)
+        if future.exception():
+            logger.error("Variant job crashed", exc_info=future.exception())
+
+    def wait(self, timeout=None):
+        """Block until all queued jobs are finished."""
+        with self._lock:
+            pending = list(self.pending)
+        wait(pending, timeout)
+
+
+def get_variant_worker():
+    worker = current_app.extensions.get('variant_worker')
+    if worker is None:
+        worker = current_app.extensions['variant_worker'] = VariantWorker(
+            current_app._get_current_object(), current_app.config['MEDIA_WORKERS'])
+    return worker
+
+
+def pick_variant(url, variants, width):
+    """Smallest variant at least width wide, the largest one, or the original."""
+    if not variants:
+        return url
+    sizes = sorted((int(size), variant) for size, variant in json.loads(variants).items())
+    for size, variant in sizes:
+        if size >= width:
+            return variant
+    return sizes[-1][1]
@@ -0,0 +1,79 @@
+"""Seeded synthetic data: users, a power-law follow graph, tweets, likes, attachments."""
+import random
+from collections import Counter
+
+from sqlalchemy import func, insert, select, text
+
+from app.models import Attachment, Follow, Like, Tweet, User
+
+BATCH = 5000
+
+
+def _bulk(session, model, rows):
+    for start in range(0, len(rows), BATCH):
+        session.execute(insert(model), rows[start:start + BATCH])
+
+
+def _sync_sequence(session, table):
+    # Ids were inserted explicitly, move the serial past them for later inserts.
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                             f"(SELECT max(id) FROM {table}))"))
+
+
+def _popularity(count, alpha, rng):
+    """Zipf-like weights over a shuffled order, so popular ids are spread out."""
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return [1 / rank ** alpha for rank in ranks]
+
+
+def generate(session, users=1000, follows_per_user=50, tweets=10000, likes_per_tweet=10,
+             attachment_ratio=0.1, alpha=1.2, seed=42):
+    """Fill an empty database, return the api keys of the generated users.
+
+    Followees and liked tweets are drawn with power-law weights, so a few
+    users and tweets collect most follows and likes, as on a real network.
+    Denormalized counters are filled in to match the rows.
+    """
+    rng = random.Random(seed)
+    first_id = (session.scalar(select(func.max(User.id))) or 0) + 1
+    user_ids = list(range(first_id, first_id + users))
+    api_keys = [f'bench-{seed}-{user_id}' for user_id in user_ids]
+    user_weights = _popularity(users, alpha, rng)
+
+    follows = set()
+    for follower in user_ids:
+        for followee in rng.choices(user_ids, user_weights, k=follows_per_user):
+            if followee != follower:
+                follows.add((follower, followee))
+    followers_count = Counter(followee for _, followee in follows)
+    following_count = Counter(follower for follower, _ in follows)
+    _bulk(session, User, [
+        {'id': user_id, 'api_key': api_key, 'name': f'User@{user_id}',
+         'followers_count': followers_count[user_id], 'following_count': following_count[user_id]}
+        for user_id, api_key in zip(user_ids, api_keys)])
+    _sync_sequence(session, 'users')
+    _bulk(session, Follow, [{'follower_id': follower, 'follow_on_id': followee}
+                            for follower, followee in follows])
+
+    first_tweet = (session.scalar(select(func.max(Tweet.id))) or 0) + 1
+    tweet_ids = list(range(first_tweet, first_tweet + tweets))
+    authors = rng.choices(user_ids, user_weights, k=tweets)
+    tweet_weights = _popularity(tweets, alpha, rng)
+    likes = set()
+    for _ in range(tweets * likes_per_tweet):
+        likes.add((rng.choices(tweet_ids, tweet_weights)[0], rng.choice(user_ids)))
+    like_count = Counter(tweet_id for tweet_id, _ in likes)
+    _bulk(session, Tweet, [
+        {'id': tweet_id, 'author_id': author, 'content': f'Synthetic tweet {tweet_id}',
+         'like_count': like_count[tweet_id]}
+        for tweet_id, author in zip(tweet_ids, authors)])
+    _sync_sequence(session, 'tweets')
+    _bulk(session, Like, [{'tweet_id': tweet_id, 'user_id': user_id} for tweet_id, user_id in likes])
+    _bulk(session, Attachment, [
+        {'tweet_id': tweet_id, 'url': f'/media/{tweet_id:064x}.png', 'src': f'{tweet_id}.png',
+         'variants_status': 'skipped'}
+        for tweet_id in tweet_ids if rng.random() < attachment_ratio])
+    session.commit()
+    return api_keys
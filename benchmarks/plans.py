@@ -0,0 +1,105 @@
+"""Query-plan regression check for the hot lookups.
+
+    python -m benchmarks.plans --database-url postgresql://... [--seed]
+
+Runs EXPLAIN for each hot query against the current data (seeding it
+first with --seed) and exits with status 1 if any plan reads a whole
+table. On PostgreSQL sequential scans are disabled for the check, so a
+Seq Scan in the plan means no usable index exists rather than that the
+planner preferred a scan of a small table.
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import func, select, text
+
+from .datagen import generate
+
+
+def hot_queries(session):
+    """name -> statement, with ids taken from the data in the database."""
+    from app.cache import AuthUser
+    from app.feed import feed_query
+    from app.models import Attachment, Follow, Like, Tweet, User
+    from app.profiles import follow_page_query
+    from app.sync import feed_version_query
+    from app.utils import attachments_query, likes_query
+
+    user_id, api_key = session.execute(
+        select(User.id, User.api_key).order_by(User.followers_count.desc()).limit(1)).one()
+    tweet_ids = session.scalars(select(Tweet.id).order_by(Tweet.like_count.desc()).limit(20)).all()
+    sha256 = session.scalar(select(func.max(Attachment.sha256))) or ''
+    return {
+        'auth': select(User.id, User.name).where(User.api_key == api_key),
+        'feed': feed_query(AuthUser(user_id, None)).limit(21),
+        'feed_version': feed_version_query(user_id),
+        'followers': follow_page_query(user_id, 'followers', 51),
+        'following': follow_page_query(user_id, 'following', 51),
+        'likes_by_tweet': likes_query(tweet_ids).statement,
+        'likes_by_user': select(Like.tweet_id).where(Like.user_id == user_id),
+        'attachments_by_tweet': attachments_query(tweet_ids).statement,
+        'attachment_by_sha256': select(Attachment.id).where(Attachment.sha256 == sha256),
+        'fanout_followers': select(Follow.follower_id).where(Follow.follow_on_id == user_id),
+        'tweets_by_author': (select(Tweet.id, Tweet.author_id).where(Tweet.author_id == user_id)
+                             .order_by(Tweet.id.desc()).limit(200)),
+    }
+
+
+def explain(session, statement):
+    """Plan lines of statement."""
+    dialect = session.get_bind().dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'sqlite':
+        return [row[3] for row in session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+    return [row[0] for row in session.execute(text('EXPLAIN ' + sql))]
+
+
+def full_scans(session, lines):
+    if session.get_bind().dialect.name == 'sqlite':
+        return [line for line in lines if line.startswith('SCAN ')]
+    return [line for line in lines if 'Seq Scan' in line]
+
+
+def check(session):
+    """name -> plan lines that read a whole table, for the failing queries."""
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(text('SET LOCAL enable_seqscan = off'))
+    failures = {}
+    try:
+        for name, statement in hot_queries(session).items():
+            scans = full_scans(session, explain(session, statement))
+            if scans:
+                failures[name] = scans
+    finally:
+        session.rollback()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='sets DATABASE_URL for the app')
+    parser.add_argument('--seed', action='store_true', help='fill the database with generated data first')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--tweets', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    from app.app import create_app, db
+    app = create_app()
+    with app.app_context():
+        if args.seed:
+            db.create_all()
+            generate(db.session, users=args.users, tweets=args.tweets)
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+        failures = check(db.session)
+    for name, scans in failures.items():
+        print(f'{name}: ' + '; '.join(scans), file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark runner.
+
+    python -m benchmarks.run --database-url sqlite:////tmp/bench.db --users 1000 \\
+        --tweets 10000 --out current.json --compare baseline.json
+
+Seeds the database (unless --no-seed), runs the scenarios through the Flask
+test client, or against --live http://host:5000, and writes a JSON report.
+With --compare, prints the change of every metric against an earlier report.
+"""
+import argparse
+import json
+import os
+import sys
+
+from sqlalchemy import select
+
+from .datagen import generate
+from .scenarios import SCENARIOS, LiveClient, TestClient, run_scenario
+
+COMPARED = (('throughput_rps', 'higher'), ('latency_ms.p50', 'lower'),
+            ('latency_ms.p99', 'lower'), ('queries_per_request', 'lower'))
+
+
+def run(app, scenarios, iterations, seed=42, seed_data=None, live=None):
+    """Optionally seed the app's database, run scenarios, return the report."""
+    from app.app import db
+    from app.models import Tweet, User
+
+    with app.app_context():
+        if seed_data is not None:
+            db.create_all()
+            generate(db.session, seed=seed, **seed_data)
+        users = db.session.execute(select(User.id, User.api_key)).all()
+        tweet_ids = db.session.scalars(select(Tweet.id)).all()
+    user_ids = [user_id for user_id, _ in users]
+    api_keys = [api_key for _, api_key in users]
+
+    if live:
+        client = LiveClient(live)
+    else:
+        app.config['SQL_TIMING_HEADERS'] = True
+        client = TestClient(app)
+    return {
+        'target': live or 'test-client',
+        'seed': seed,
+        'dataset': {'users': len(user_ids), 'tweets': len(tweet_ids)},
+        'scenarios': {name: run_scenario(client, name, iterations, api_keys, tweet_ids, user_ids, seed)
+                      for name in scenarios},
+    }
+
+
+def _metric(result, path):
+    for key in path.split('.'):
+        result = result.get(key) if result else None
+    return result
+
+
+def compare(current, baseline):
+    """Lines describing the relative change of each metric per scenario."""
+    lines = []
+    for name, result in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        for path, better in COMPARED:
+            new, old = _metric(result, path), _metric(before, path)
+            if not new or not old:
+                continue
+            change = (new - old) / old * 100
+            improved = change > 0 if better == 'higher' else change < 0
+            lines.append(f'{name:16} {path:20} {old:>10} -> {new:>10} '
+                         f'({change:+.1f}%{", better" if improved else ""})')
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='sets DATABASE_URL for the app')
+    parser.add_argument('--live', help='base url of a running server')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='repeatable, all scenarios by default')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-seed', action='store_true', help='use the existing data')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--follows-per-user', type=int, default=50)
+    parser.add_argument('--tweets', type=int, default=10000)
+    parser.add_argument('--likes-per-tweet', type=int, default=10)
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--compare', help='earlier JSON report to compare with')
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    from app.app import create_app
+    app = create_app()
+
+    seed_data = None if args.no_seed else {
+        'users': args.users, 'follows_per_user': args.follows_per_user,
+        'tweets': args.tweets, 'likes_per_tweet': args.likes_per_tweet,
+    }
+    report = run(app, args.scenario or list(SCENARIOS), args.iterations, args.seed, seed_data, args.live)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as out:
+            out.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as baseline:
+            print('\n'.join(compare(report, json.load(baseline))), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Request scenarios, runnable through the Flask test client or against a live server."""
+import io
+import random
+import struct
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zlib
+
+
+class TestClient:
+    """Adapter over app.test_client() returning (status, headers)."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, api_key, json=None, data=None):
+        response = self.client.open(path, method=method, headers={'Api-Key': api_key},
+                                    json=json, data=data)
+        response.close()
+        return response.status_code, response.headers
+
+
+class LiveClient:
+    """Same interface over HTTP to a running server."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, api_key, json=None, data=None):
+        import json as json_module
+        headers = {'Api-Key': api_key}
+        body = None
+        if json is not None:
+            body = json_module.dumps(json).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            boundary = uuid.uuid4().hex
+            name, (stream, filename) = next(iter(data.items()))
+            body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                    f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n').encode() \
+                + stream.read() + f'\r\n--{boundary}--\r\n'.encode()
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        request = urllib.request.Request(self.base_url + path, body, headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status, response.headers
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers
+
+
+def tiny_png(rng):
+    """A valid 1x1 PNG of a random colour, so uploads are not deduplicated."""
+    def chunk(kind, payload):
+        return struct.pack('>I', len(payload)) + kind + payload + \
+            struct.pack('>I', zlib.crc32(kind + payload))
+    pixel = bytes([0] + [rng.randrange(256) for _ in range(3)])
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(pixel)) + chunk(b'IEND', b''))
+
+
+def feed(client, rng, api_keys, tweet_ids, user_ids):
+    return [client.request('GET', '/api/tweets/', rng.choice(api_keys))]
+
+
+def profile(client, rng, api_keys, tweet_ids, user_ids):
+    return [client.request('GET', '/api/users/me', rng.choice(api_keys)),
+            client.request('GET', f'/api/users/{rng.choice(user_ids)}', rng.choice(api_keys))]
+
+
+def like_unlike(client, rng, api_keys, tweet_ids, user_ids):
+    api_key, tweet_id = rng.choice(api_keys), rng.choice(tweet_ids)
+    return [client.request('POST', f'/api/tweets/{tweet_id}/likes', api_key),
+            client.request('DELETE', f'/api/tweets/{tweet_id}/likes', api_key)]
+
+
+def follow_unfollow(client, rng, api_keys, tweet_ids, user_ids):
+    api_key, user_id = rng.choice(api_keys), rng.choice(user_ids)
+    return [client.request('POST', f'/api/users/{user_id}/follow', api_key),
+            client.request('DELETE', f'/api/users/{user_id}/follow', api_key)]
+
+
+def upload(client, rng, api_keys, tweet_ids, user_ids):
+    data = {'file': (io.BytesIO(tiny_png(rng)), 'bench.png')}
+    return [client.request('POST', '/api/medias/', rng.choice(api_keys), data=data)]
+
+
+SCENARIOS = {
+    'feed': feed,
+    'profile': profile,
+    'like_unlike': like_unlike,
+    'follow_unfollow': follow_unfollow,
+    'upload': upload,
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(client, name, iterations, api_keys, tweet_ids, user_ids, seed=0):
+    """Run one scenario, return throughput, latency percentiles and queries per request."""
+    rng = random.Random(seed)
+    scenario = SCENARIOS[name]
+    latencies = []
+    queries = []
+    requests = errors = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        responses = scenario(client, rng, api_keys, tweet_ids, user_ids)
+        latencies.append((time.perf_counter() - start) * 1000 / len(responses))
+        requests += len(responses)
+        for status, headers in responses:
+            errors += status >= 500
+            if headers.get('X-Query-Count') is not None:
+                queries.append(int(headers['X-Query-Count']))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': round(requests / elapsed, 2),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p90': round(percentile(latencies, 0.90), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+        },
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
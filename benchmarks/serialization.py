@@ -0,0 +1,69 @@
+"""Feed serialization: marshal + json against the fast path.
+
+    python -m benchmarks.serialization --tweets 100 --likes 20 --rounds 200
+
+Builds a synthetic feed page and times turning it into response bytes
+both ways, with no database involved.
+"""
+import argparse
+import json
+import time
+
+
+def synthetic_feed(tweets=100, likes=20, attachments=1):
+    return {
+        "result": True,
+        "tweets": [
+            {"id": tweet_id,
+             "content": f"tweet {tweet_id} " * 8,
+             "attachments": [f"/media/{tweet_id:064x}_{n}.png" for n in range(attachments)],
+             "author": {"id": tweet_id % 50, "name": f"User@{tweet_id % 50}"},
+             "likes": [{"user_id": user_id, "name": f"User@{user_id}"} for user_id in range(likes)]}
+            for tweet_id in range(tweets, 0, -1)],
+        "next_cursor": "eyJ2IjpbMCwxXX0",
+        "since_id": 12345,
+    }
+
+
+def measure(app, body, rounds=100):
+    """Milliseconds per response for both paths; checks they produce the same JSON."""
+    from app.serialization import dumps, shape
+
+    model = app.extensions['api'].models['Tweets']
+    fast = app.config['FAST_SERIALIZATION']
+    paths = {
+        # What flask-restx did before: marshal_list_with, then json.dumps.
+        'marshal_json': (False, lambda data: (json.dumps(data) + '\n').encode()),
+        'fast': (True, dumps),
+    }
+    report, outputs = {}, {}
+    try:
+        with app.test_request_context():
+            for name, (mode, encode) in paths.items():
+                app.config['FAST_SERIALIZATION'] = mode
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    output = encode(shape(body, model))
+                report[name] = (time.perf_counter() - start) * 1000 / rounds
+                outputs[name] = json.loads(output)
+    finally:
+        app.config['FAST_SERIALIZATION'] = fast
+    report['speedup'] = report['marshal_json'] / report['fast']
+    report['identical'] = outputs['marshal_json'] == outputs['fast']
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tweets', type=int, default=100)
+    parser.add_argument('--likes', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    from app.app import create_app
+    report = measure(create_app(), synthetic_feed(args.tweets, args.likes), args.rounds)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
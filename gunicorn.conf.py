@@ -0,0 +1,39 @@
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+accesslog = '-'
+
+# gthread: GUNICORN_THREADS requests per worker at a time.
+# gevent: one greenlet per connection, up to GUNICORN_WORKER_CONNECTIONS per
+# worker; socket and database waits yield instead of holding a thread, so
+# slow clients and slow queries no longer use up the worker. Concurrent
+# database work is still bounded by DB_POOL_SIZE + DB_MAX_OVERFLOW.
+# Image variants are resized on gevent's native thread pool, so CPU-bound
+# Pillow work does not block the worker's connections.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+
+def on_starting(server):
+    # Samples of a previous run must not leak into the new one.
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 waits in C; make it wait on the gevent hub instead.
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
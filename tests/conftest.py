@@ -4,14 +4,18 @@ import pytest
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.datastructures import FileStorage
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///parking.db")
+
 from app.app import create_app, db as _db
 from app.models import *
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     """Create and configure a new app instance for each test."""
     _app = create_app()
     _app.config["TESTING"] = True
+    _app.config["UPLOAD_FOLDER"] = str(tmp_path / "uploads")
     _app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///parking.db"
     _app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
@@ -20,6 +24,8 @@ def app():
 
     yield _app
 
+    if "variant_worker" in _app.extensions:
+        _app.extensions["variant_worker"].wait()
     with _app.app_context():
         _db.drop_all()
 
@@ -87,7 +93,7 @@ def follow_factory(db, user_factory):
             follower = user_factory()
         if followed is None:
             followed = user_factory(name='followed', api_key='followed-api-key')
-        follow = Follow(follower_id=follower.id, followee_id=followed.id)
+        follow = Follow(follower_id=follower.id, follow_on_id=followed.id)
         db.add(follow)
         db.commit()
         return follow
@@ -100,7 +106,7 @@ def like_factory(db, user_factory, tweet_factory):
             tweet = tweet_factory()
         if user is None:
             user = user_factory()
-        like = Like(tweet=tweet.id, user=user.id)
+        like = Like(tweet_id=tweet.id, user_id=user.id)
         db.add(like)
         db.commit()
         return like
@@ -0,0 +1,44 @@
+import gzip
+
+import pytest
+
+from app.assets import AssetManifest, compress_assets
+
+
+@pytest.fixture
+def dist(app, tmp_path):
+    folder = tmp_path / 'dist'
+    (folder / 'js').mkdir(parents=True)
+    (folder / 'index.html').write_text('<html>' + 'x' * 2000 + '</html>')
+    (folder / 'js' / 'app.ee2cdef2.js').write_text('console.log(1);' * 200)
+    (folder / 'js' / 'app.ee2cdef2.js.map').write_text('{}')
+    compress_assets(str(folder))
+    app.extensions['assets'] = AssetManifest(str(folder))
+    return folder
+
+
+def test_fingerprinted_asset_is_immutable_and_precompressed(client, dist):
+    """Hashed bundles are cached forever and served gzipped when accepted."""
+    response = client.get('/js/app.ee2cdef2.js', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == (dist / 'js' / 'app.ee2cdef2.js').read_bytes()
+
+
+def test_index_is_revalidated(client, dist):
+    """index.html and unknown SPA routes are always revalidated."""
+    for path in ('/', '/profile/1'):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert 'Content-Encoding' not in response.headers
+        assert 'no-cache' in response.headers['Cache-Control']
+        assert response.data.startswith(b'<html>')
+
+
+def test_source_maps_can_be_hidden(app, client, dist):
+    """Source maps are not served when SERVE_SOURCE_MAPS is off."""
+    assert client.get('/js/app.ee2cdef2.js.map').status_code == 200
+    app.extensions['assets'] = AssetManifest(str(dist), source_maps=False)
+    assert client.get('/js/app.ee2cdef2.js.map').status_code == 404
@@ -0,0 +1,87 @@
+from sqlalchemy import event
+
+from app.app import db as _db
+from app.cache import AuthCache, AuthUser, LocalSharedCache, LRUCache, get_auth_cache
+from app.events import LocalBroker
+
+
+def count_user_queries(app, client, path, headers):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM users' in statement:
+            statements.append(statement)
+
+    with app.app_context():
+        engine = _db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        client.get(path, headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return len(statements)
+
+
+def test_repeated_requests_skip_user_lookup(app, client, auth_headers, user):
+    """Only the first request with a key reads the users table."""
+    client.get('/api/tweets/', headers=auth_headers)
+    assert count_user_queries(app, client, '/api/tweets/', auth_headers) == 0
+    with app.app_context():
+        stats = get_auth_cache().stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == 0.5
+
+
+def test_user_update_invalidates_cache(app, client, db, user):
+    """Renaming a user drops the cached entry."""
+    headers = {'Api-Key': user.api_key}
+    client.get('/api/tweets/', headers=headers)
+    user.name = 'renamed'
+    db.flush()
+    with app.app_context():
+        assert len(get_auth_cache().local) == 1
+    db.commit()
+
+    with app.app_context():
+        assert len(get_auth_cache().local) == 0
+
+
+def test_invalidation_reaches_every_worker():
+    """Caches sharing a channel all drop an invalidated key."""
+    channel = LocalBroker()
+    first = AuthCache(maxsize=10, ttl=60, channel=channel)
+    second = AuthCache(maxsize=10, ttl=60, channel=channel)
+    for cache in (first, second):
+        cache.set('key', AuthUser(1, 'User@1'))
+    first.invalidate('key')
+    assert first.get('key') is None and second.get('key') is None
+
+
+def test_shared_backend_fills_other_workers():
+    """A second worker picks the entry up from the shared backend."""
+    shared = LocalSharedCache()
+    first = AuthCache(maxsize=10, ttl=60, shared=shared)
+    second = AuthCache(maxsize=10, ttl=60, shared=shared)
+    first.set('key', AuthUser(1, 'User@1'))
+
+    assert second.get('key') == (1, 'User@1')
+    first.invalidate('key')
+    second.local.clear()
+    assert second.get('key') is None
+
+
+def test_lru_cache_is_bounded_and_expires():
+    """Old entries are evicted first and expired ones are not returned."""
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert len(cache) == 2
+
+    expired = LRUCache(maxsize=2, ttl=-1)
+    expired.set('a', 1)
+    assert expired.get('a') is None
@@ -0,0 +1,47 @@
+from benchmarks.datagen import generate
+from benchmarks.run import compare, run
+from benchmarks.serialization import measure, synthetic_feed
+from app.models import Follow, Like, Tweet, User
+
+
+def test_generator_is_seeded_and_consistent(db):
+    """Generated data is reproducible and counters match the rows."""
+    generate(db, users=30, follows_per_user=5, tweets=60, likes_per_tweet=3, seed=7)
+
+    assert db.query(User).count() == 30
+    assert db.query(Tweet).count() == 60
+    total_likes = sum(tweet.like_count for tweet in db.query(Tweet))
+    assert total_likes == db.query(Like).count()
+    assert sum(user.followers_count for user in db.query(User)) == db.query(Follow).count()
+    first = sorted((like.tweet_id, like.user_id) for like in db.query(Like))
+
+    db.query(Like).delete()
+    db.query(Follow).delete()
+    db.query(Tweet).delete()
+    db.query(User).delete()
+    db.commit()
+    generate(db, users=30, follows_per_user=5, tweets=60, likes_per_tweet=3, seed=7)
+    assert sorted((like.tweet_id, like.user_id) for like in db.query(Like)) == first
+
+
+def test_run_reports_and_compares(app):
+    """The runner reports latency percentiles and queries per request."""
+    seed_data = {'users': 20, 'follows_per_user': 5, 'tweets': 40, 'likes_per_tweet': 2}
+    report = run(app, ['feed', 'like_unlike'], iterations=5, seed_data=seed_data)
+
+    feed = report['scenarios']['feed']
+    assert feed['requests'] == 5
+    assert feed['errors'] == 0
+    assert feed['latency_ms']['p50'] <= feed['latency_ms']['p99']
+    assert feed['queries_per_request'] >= 1
+    assert report['scenarios']['like_unlike']['requests'] == 10
+
+    lines = compare(report, report)
+    assert any('feed' in line and '+0.0%' in line for line in lines)
+
+
+def test_serialization_paths_agree(app):
+    """The fast path produces the same JSON as marshal + json."""
+    report = measure(app, synthetic_feed(tweets=5, likes=3), rounds=2)
+    assert report['identical']
+    assert report['marshal_json'] > 0 and report['fast'] > 0
@@ -0,0 +1,68 @@
+import gzip
+import io
+import json
+import zlib
+
+import pytest
+from flask import Response
+
+from app.compression import compress_response
+
+
+@pytest.fixture
+def big_feed(client, auth_headers, tweet_factory, user_factory, db):
+    author = user_factory(api_key='test-api-key')
+    for _ in range(30):
+        tweet_factory(author=author)
+
+
+def test_feed_gzipped_for_clients_that_accept_it(client, auth_headers, big_feed):
+    """Large JSON goes out gzipped, with Vary and a weak ETag, and decodes to the same body."""
+    plain = client.get('/api/tweets/', headers=auth_headers)
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    response = client.get('/api/tweets/', headers={**auth_headers, 'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert int(response.headers['Content-Length']) < len(plain.data)
+    assert json.loads(gzip.decompress(response.data)) == plain.json
+    assert response.headers['ETag'].startswith('W/')
+
+
+def test_small_responses_left_alone(app, client, auth_headers):
+    """Bodies under COMPRESS_MIN_SIZE are not worth compressing."""
+    response = client.get('/api/users/me', headers={**auth_headers, 'Accept-Encoding': 'gzip'})
+    assert len(response.data) < app.config['COMPRESS_MIN_SIZE']
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_media_not_compressed(client, auth_headers):
+    """Uploaded files are served as they are."""
+    content = open('tests/test.png', 'rb').read()
+    response = client.post('/api/medias/', headers=auth_headers,
+                           data={'file': (io.BytesIO(content), 'test.png')})
+    url = client.get(f'/api/medias/{response.json["media_id"]}', headers=auth_headers).json['url']
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == content
+
+
+def test_streamed_body_flushed_per_chunk(app):
+    """Each chunk of a streamed body can be decoded as soon as it arrives."""
+    chunks = ['{"a": 1}\n', '{"b": 2}\n']
+    with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+        response = compress_response(app, Response(iter(chunks), mimetype='application/json'))
+        assert response.headers['Content-Encoding'] == 'gzip'
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = iter(response.response)
+        for chunk in chunks:
+            assert decoder.decompress(next(body)).decode() == chunk
+
+
+def test_brotli_preferred_when_available(client, auth_headers, big_feed):
+    """With the brotli package installed, br wins over gzip."""
+    brotli = pytest.importorskip('brotli')
+    plain = client.get('/api/tweets/', headers=auth_headers)
+    response = client.get('/api/tweets/', headers={**auth_headers, 'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(response.data)) == plain.json
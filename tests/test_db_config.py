@@ -0,0 +1,39 @@
+from sqlalchemy.pool import NullPool
+
+from app.db_config import engine_options
+from app.metrics import TimedQueuePool
+
+PG_URL = 'postgresql://admin:admin@db:5432/twitter_db'
+
+
+def test_pool_settings_from_environment():
+    """Pool size, overflow, recycle and statement timeout come from env."""
+    options = engine_options(PG_URL, {
+        'DB_POOL_SIZE': '8', 'DB_MAX_OVERFLOW': '2', 'DB_POOL_RECYCLE': '600',
+        'DB_POOL_PRE_PING': '0', 'DB_STATEMENT_TIMEOUT_MS': '5000',
+    })
+    assert options['poolclass'] is TimedQueuePool
+    assert options['pool_size'] == 8
+    assert options['max_overflow'] == 2
+    assert options['pool_recycle'] == 600
+    assert options['pool_pre_ping'] is False
+    assert options['connect_args'] == {'options': '-c statement_timeout=5000'}
+
+
+def test_external_pooler_mode_keeps_no_connections():
+    """Behind PgBouncer the app uses NullPool and no startup options."""
+    options = engine_options(PG_URL, {'DB_EXTERNAL_POOLER': '1', 'DB_STATEMENT_TIMEOUT_MS': '5000'})
+    assert options == {'poolclass': NullPool}
+
+
+def test_sqlite_keeps_driver_defaults():
+    """SQLite urls get no pool options."""
+    assert engine_options('sqlite:///parking.db', {'DB_POOL_SIZE': '8'}) == {}
+
+
+def test_pool_gauges_exposed(client, auth_headers):
+    """Connections in use and open connections are reported in /metrics."""
+    client.get('/api/tweets/', headers=auth_headers)
+    text = client.get('/metrics').data.decode()
+    assert 'db_pool_checked_out ' in text
+    assert 'db_pool_connections ' in text
@@ -0,0 +1,24 @@
+import logging
+
+
+def test_query_count_header(app, client, auth_headers, tweet):
+    """Responses report query count and DB time when enabled."""
+    app.config['SQL_TIMING_HEADERS'] = True
+    response = client.get('/api/tweets/', headers=auth_headers)
+    assert int(response.headers['X-Query-Count']) >= 1
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+
+
+def test_no_headers_by_default(client, auth_headers):
+    """Timing headers stay off outside debug mode."""
+    response = client.get('/api/tweets/', headers=auth_headers)
+    assert 'X-Query-Count' not in response.headers
+
+
+def test_slow_request_is_logged(app, client, auth_headers, caplog):
+    """Requests over the query threshold are logged with their slowest statements."""
+    app.config['SLOW_REQUEST_QUERIES'] = 0
+    with caplog.at_level(logging.WARNING, logger='app.instrumentation'):
+        client.get('/api/tweets/', headers=auth_headers)
+    assert 'Slow request GET /api/tweets/' in caplog.text
+    assert 'SELECT' in caplog.text
@@ -0,0 +1,118 @@
+import pytest
+
+from app.app import create_app
+from app.likebuffer import get_like_buffer
+from app.models import Like, LikeIntent, Tweet
+
+
+def enable_write_behind(app):
+    app.config['LIKE_WRITE_BEHIND'] = True
+    app.config['LIKE_FLUSH_INTERVAL'] = 0
+
+
+@pytest.fixture
+def buffered(app):
+    """Write-behind likes, flushed only when the test says so."""
+    enable_write_behind(app)
+    yield app
+    if 'like_buffer' in app.extensions:
+        app.extensions['like_buffer'].close()
+
+
+@pytest.fixture
+def other_worker(buffered):
+    """A second app on the same database, as another gunicorn worker."""
+    app = create_app()
+    app.config.update(TESTING=True, UPLOAD_FOLDER=buffered.config['UPLOAD_FOLDER'])
+    enable_write_behind(app)
+    return app
+
+
+def feed_likes(client, headers):
+    return [like['user_id'] for like in client.get('/api/tweets/', headers=headers).json['tweets'][0]['likes']]
+
+
+def flush(app):
+    with app.app_context():
+        return get_like_buffer().flush()
+
+
+def test_pending_like_visible_before_flush(buffered, client, db, auth_headers, tweet):
+    response = client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    assert response.status_code == 201
+    assert feed_likes(client, auth_headers) == [tweet.author_id]
+    assert db.query(Like).count() == 0
+
+    assert flush(buffered) == 1
+    db.expire_all()
+    assert db.query(Like).count() == 1
+    assert db.query(LikeIntent).count() == 0
+    assert db.get(Tweet, tweet.id).like_count == 1
+
+
+def test_repeated_intents_are_idempotent(buffered, client, db, auth_headers, tweet, like_factory):
+    like_factory(tweet=tweet)
+    for _ in range(3):
+        client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    client.delete(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    assert flush(buffered) == 1
+    client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    assert flush(buffered) == 0
+    db.expire_all()
+    assert db.query(Like).count() == 2
+    assert db.get(Tweet, tweet.id).like_count == 1  # like_factory leaves the counter alone
+
+
+def test_pending_unlike_hides_stored_like(buffered, client, db, auth_headers, tweet):
+    client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    flush(buffered)
+    etag = client.get('/api/tweets/', headers=auth_headers).headers['ETag']
+    client.delete(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    response = client.get('/api/tweets/', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['tweets'][0]['likes'] == []
+
+    assert flush(buffered) == 1
+    db.expire_all()
+    assert db.query(Like).count() == 0
+    assert db.get(Tweet, tweet.id).like_count == 0
+
+
+def test_intents_for_deleted_tweets_dropped(buffered, client, db, auth_headers, tweet):
+    client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    client.post('/api/tweets/999/likes', headers=auth_headers)
+    assert flush(buffered) == 1
+    assert db.query(Like).count() == 1
+
+
+def test_last_intent_wins_across_workers(buffered, other_worker, client, db, auth_headers, tweet):
+    """A like on one worker and an unlike on another end as an unlike, seen by both."""
+    other = other_worker.test_client()
+    client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    assert feed_likes(other, auth_headers) == [tweet.author_id]
+    other.delete(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    assert feed_likes(client, auth_headers) == []
+
+    assert flush(buffered) == 0
+    db.expire_all()
+    assert db.query(Like).count() == 0
+    assert db.get(Tweet, tweet.id).like_count == 0
+
+
+def test_stopped_worker_loses_nothing(buffered, other_worker, client, db, auth_headers, tweet):
+    client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    buffered.extensions['like_buffer'].close()
+    assert flush(other_worker) == 1
+    assert db.query(Like).count() == 1
+
+
+def test_buffered_like_answers_like_a_direct_one(buffered, client, auth_headers, tweet):
+    response = client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    assert response.status_code == 201
+    assert response.json == {'result': True, 'tweet_id': tweet.id, 'like_count': 1}
+    assert client.post('/api/tweets/999/likes', headers=auth_headers).status_code == 404
+
+    response = client.post('/api/tweets/likes:batch', headers=auth_headers, json={'tweet_ids': [tweet.id, 999]})
+    assert response.json == {'result': True, 'likes': [{'tweet_id': tweet.id, 'like_count': 1}],
+                             'not_found': [999]}
@@ -1,4 +1,15 @@
+import hashlib
+import io
 import json
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+from app import variants
+from app.models import Attachment, Tweet
+from app.variants import get_variant_worker
 
 
 def test_upload_media_unauthorized(client, test_file):
@@ -26,3 +37,164 @@ def test_upload_media_success(client, auth_headers, test_file, app):
     data = json.loads(response.data)
     assert data['result'] is True
     assert 'media_id' in data
+
+
+def upload(client, headers, content, filename='test.png'):
+    return client.post(
+        '/api/medias/',
+        headers=headers,
+        data={'file': (io.BytesIO(content), filename)}
+    )
+
+
+def test_upload_media_content_addressed(client, auth_headers, app):
+    """Uploads are stored under their SHA-256; identical files share the blob, not the row."""
+    content = open('tests/test.png', 'rb').read()
+    digest = hashlib.sha256(content).hexdigest()
+
+    first = json.loads(upload(client, auth_headers, content).data)
+    second = json.loads(upload(client, auth_headers, content, 'copy.png').data)
+
+    assert first['media_id'] != second['media_id']
+    folder = app.config['UPLOAD_FOLDER']
+    assert open(os.path.join(folder, digest[:2], digest[2:4], f'{digest}.png'), 'rb').read() == content
+    assert os.listdir(os.path.join(folder, 'tmp')) == []
+    urls = {client.get(f'/api/medias/{media["media_id"]}', headers=auth_headers).json['url']
+            for media in (first, second)}
+    assert len(urls) == 1
+
+
+def test_same_file_attached_by_two_users(client, db, user_factory):
+    """Two tweets with the same picture both keep it."""
+    content = open('tests/test.png', 'rb').read()
+    tweet_ids = []
+    for author in (user_factory(), user_factory()):
+        headers = {'Api-Key': author.api_key}
+        media_id = json.loads(upload(client, headers, content).data)['media_id']
+        response = client.post('/api/tweets/', headers=headers,
+                               json={'tweet_data': 'pic', 'tweet_media_ids': [media_id]})
+        tweet_ids.append(response.json['tweet_id'])
+    for tweet_id in tweet_ids:
+        assert db.query(Attachment).filter_by(tweet_id=tweet_id).count() == 1
+
+
+def test_upload_media_too_large(client, auth_headers, app):
+    """Uploads above MAX_CONTENT_LENGTH are rejected."""
+    app.config['MAX_CONTENT_LENGTH'] = 1024
+    response = upload(client, auth_headers, b'x' * 4096)
+    assert response.status_code == 413
+
+
+def test_upload_media_generates_variants(client, auth_headers, app):
+    """Variants are built in the background and reported by the status endpoint."""
+    content = open('tests/test.png', 'rb').read()
+    media_id = json.loads(upload(client, auth_headers, content).data)['media_id']
+    with app.app_context():
+        get_variant_worker().wait(timeout=10)
+
+    data = json.loads(client.get(f'/api/medias/{media_id}', headers=auth_headers).data)
+    assert data['status'] == 'ready'
+    widths = sorted(int(width) for width in data['variants'])
+    assert widths == [320, 640, 822]
+    variant = client.get(data['variants']['320'])
+    with Image.open(io.BytesIO(variant.data)) as image:
+        assert image.width == 320
+        assert 'dpi' not in image.info
+
+
+def test_variants_follow_exif_orientation(client, auth_headers, app):
+    """A photo tagged as rotated gets upright variants."""
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees clockwise to display
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 20)).save(buffer, 'JPEG', exif=exif)
+    media_id = json.loads(upload(client, auth_headers, buffer.getvalue(), 'photo.jpg').data)['media_id']
+    with app.app_context():
+        get_variant_worker().wait(timeout=10)
+
+    data = json.loads(client.get(f'/api/medias/{media_id}', headers=auth_headers).data)
+    assert list(data['variants']) == ['20']
+    with Image.open(io.BytesIO(client.get(data['variants']['20']).data)) as image:
+        assert image.size == (20, 40)
+
+
+def test_animated_gif_keeps_original(client, auth_headers, app):
+    """No first-frame-only variants of animated images."""
+    buffer = io.BytesIO()
+    frames = [Image.new('RGB', (30, 30), color) for color in ('red', 'blue')]
+    frames[0].save(buffer, 'GIF', save_all=True, append_images=frames[1:])
+    media_id = json.loads(upload(client, auth_headers, buffer.getvalue(), 'anim.gif').data)['media_id']
+    with app.app_context():
+        get_variant_worker().wait(timeout=10)
+
+    data = json.loads(client.get(f'/api/medias/{media_id}', headers=auth_headers).data)
+    assert data['status'] == 'skipped'
+
+
+def test_variants_rendered_on_native_thread_under_gevent(monkeypatch):
+    """With threading patched by gevent, Pillow work leaves the hub's thread."""
+    pytest.importorskip('gevent')
+    monkeypatch.setattr(variants.monkey, 'is_module_patched', lambda name: name == 'threading')
+    caller = threading.get_native_id()
+    assert variants.run_cpu_bound(threading.get_native_id) != caller
+
+
+def test_feed_serves_feed_sized_variant(client, auth_headers, app, db, user_factory):
+    """The feed links the smallest variant that is wide enough."""
+    author = user_factory(api_key='test-api-key')
+    tweet = Tweet(author_id=author.id, content='with picture')
+    db.add(tweet)
+    db.flush()
+    db.add(Attachment(tweet_id=tweet.id, url='/u/a.png', src='a.png', variants_status='ready',
+                      variants=json.dumps({'320': '/u/a_320.png', '640': '/u/a_640.png',
+                                           '1280': '/u/a_1280.png'})))
+    db.commit()
+
+    data = json.loads(client.get('/api/tweets/', headers=auth_headers).data)
+    assert data['tweets'][0]['attachments'] == ['/u/a_640.png']
+
+
+def test_media_status_not_found(client, auth_headers):
+    """Status of an unknown media is a 404."""
+    assert client.get('/api/medias/999', headers=auth_headers).status_code == 404
+
+
+def test_media_served_with_cache_validators(client, auth_headers, app):
+    """Media urls are stable, cacheable forever and honour ETag and Range."""
+    content = open('tests/test.png', 'rb').read()
+    media_id = json.loads(upload(client, auth_headers, content).data)['media_id']
+    url = json.loads(client.get(f'/api/medias/{media_id}', headers=auth_headers).data)['url']
+    assert url.startswith('/media/')
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == content
+    assert 'immutable' in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    partial = client.get(url, headers={'Range': 'bytes=0-9'})
+    assert partial.status_code == 206
+    assert partial.data == content[:10]
+
+
+def test_media_offloaded_to_proxy(client, auth_headers, app):
+    """With x-accel offload the worker only sends a redirect header."""
+    content = open('tests/test.png', 'rb').read()
+    media_id = json.loads(upload(client, auth_headers, content).data)['media_id']
+    url = json.loads(client.get(f'/api/medias/{media_id}', headers=auth_headers).data)['url']
+    app.config['MEDIA_OFFLOAD'] = 'x-accel'
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == b''
+    digest = url.rsplit('/', 1)[1].split('.')[0]
+    assert response.headers['X-Accel-Redirect'] == \
+        f'/protected-media/{digest[:2]}/{digest[2:4]}/{digest}.png'
+
+
+def test_media_unknown_name(client):
+    """Names that are not content hashes are a 404."""
+    assert client.get('/media/passwd').status_code == 404
+    assert client.get('/media/' + '0' * 64 + '.png').status_code == 404
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+
+def test_metrics_endpoint_reports_requests(client, auth_headers, tweet):
+    """Latency and request counts are labelled by resource and method."""
+    client.get('/api/tweets/', headers=auth_headers)
+    client.get('/api/tweets/', headers=auth_headers)
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.data.decode()
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",resource="TweetList"}' in text
+    assert 'http_requests_total{method="GET",resource="TweetList",status="200"}' in text
+    assert 'auth_cache_lookups_total{result="hit"}' in text
+    assert 'db_pool_checkout_wait_seconds_count' in text
+
+
+def test_metrics_aggregate_across_processes(tmp_path):
+    """In multiprocess mode samples of all workers are summed."""
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    worker = ("from app.metrics import UPLOAD_BYTES; UPLOAD_BYTES.inc(100)")
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', worker], env=env, check=True)
+    collect = ("from app.metrics import metrics_response; "
+               "print(metrics_response().get_data(as_text=True))")
+    output = subprocess.run([sys.executable, '-c', collect], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    assert 'media_upload_bytes_total 200.0' in output
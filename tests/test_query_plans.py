@@ -0,0 +1,16 @@
+from benchmarks.datagen import generate
+from benchmarks.plans import check, explain, full_scans
+from app.models import Follow
+
+
+def test_hot_queries_use_indexes(db):
+    """No hot lookup reads a whole table."""
+    generate(db, users=50, follows_per_user=8, tweets=200, likes_per_tweet=4, attachment_ratio=0.3, seed=3)
+    assert check(db) == {}
+
+
+def test_missing_index_is_reported(db):
+    """The check does flag a lookup on an unindexed column."""
+    generate(db, users=20, follows_per_user=3, tweets=20, likes_per_tweet=1, seed=3)
+    lines = explain(db, Follow.__table__.select().where(Follow.__table__.c.id + 0 == 1))
+    assert full_scans(db, lines)
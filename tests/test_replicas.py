@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from app.app import create_app, db as _db
+from app.models import Follow, Tweet, User
+
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch):
+    """Primary and replica as two SQLite files; nothing replicates between them."""
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "primary.db"}')
+    monkeypatch.setenv('DATABASE_REPLICA_URLS', f'sqlite:///{tmp_path / "replica.db"}')
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    with app.app_context():
+        _db.create_all()
+        _db.metadata.create_all(_db.engines['replica0'])
+    yield app
+    with app.app_context():
+        _db.session.remove()
+        for engine in _db.engines.values():
+            engine.dispose()
+    # init_app registered an (empty) metadata for the bind on the shared db.
+    _db.metadatas.pop('replica0', None)
+
+
+def add_rows(app, bind, *rows):
+    with app.app_context():
+        with _db.engines[bind].begin() as conn:
+            for table, values in rows:
+                conn.execute(table.insert().values(**values))
+
+
+def seed_both(app):
+    """The same user on both sides, then a tweet only the replica has."""
+    user = (User.__table__, {'id': 1, 'name': 'alice', 'api_key': 'alice-key'})
+    add_rows(app, None, user)
+    add_rows(app, 'replica0', user,
+             (Tweet.__table__, {'id': 100, 'content': 'from replica', 'author_id': 1, 'like_count': 0}))
+
+
+def test_get_reads_from_replica(replica_app):
+    """The feed is served from the replica."""
+    seed_both(replica_app)
+    client = replica_app.test_client()
+    response = client.get('/api/tweets/', headers={'Api-Key': 'alice-key'})
+    assert [t['content'] for t in response.json['tweets']] == ['from replica']
+
+
+def test_writer_reads_own_writes(replica_app):
+    """After a write the caller reads from the primary; others still hit the replica."""
+    seed_both(replica_app)
+    add_rows(replica_app, None, (User.__table__, {'id': 2, 'name': 'bob', 'api_key': 'bob-key'}))
+    add_rows(replica_app, 'replica0', (User.__table__, {'id': 2, 'name': 'bob', 'api_key': 'bob-key'}),
+             (Follow.__table__, {'id': 1, 'follower_id': 2, 'follow_on_id': 1}))
+    client = replica_app.test_client()
+    response = client.post('/api/tweets/', headers={'Api-Key': 'alice-key'},
+                           json={'tweet_data': 'from primary'})
+    assert response.status_code == 201
+
+    response = client.get('/api/tweets/', headers={'Api-Key': 'alice-key'})
+    assert [t['content'] for t in response.json['tweets']] == ['from primary']
+    bob = replica_app.test_client()
+    response = bob.get('/api/users/1', headers={'Api-Key': 'bob-key'})
+    assert response.json['user']['name'] == 'alice'
+    response = bob.get('/api/tweets/', headers={'Api-Key': 'bob-key'})
+    assert [t['content'] for t in response.json['tweets']] == ['from replica']
+
+
+def test_sticky_cookie_reaches_other_workers(replica_app):
+    """The cookie set by a write sends the next read to the primary on any worker."""
+    seed_both(replica_app)
+    writer = replica_app.test_client()
+    writer.post('/api/tweets/', headers={'Api-Key': 'alice-key'}, json={'tweet_data': 'from primary'})
+    sticky = writer.get_cookie('replica_sticky').value
+
+    other_worker = create_app()
+    other_worker.config['TESTING'] = True
+    client = other_worker.test_client()
+    response = client.get('/api/tweets/', headers={'Api-Key': 'alice-key'})
+    assert [t['content'] for t in response.json['tweets']] == ['from replica']
+    client.set_cookie('replica_sticky', sticky)
+    response = client.get('/api/tweets/', headers={'Api-Key': 'alice-key'})
+    assert [t['content'] for t in response.json['tweets']] == ['from primary']
+    client.set_cookie('replica_sticky', str(int(time.time()) + 3600))
+    response = client.get('/api/tweets/', headers={'Api-Key': 'alice-key'})
+    assert [t['content'] for t in response.json['tweets']] == ['from replica']
+
+
+def test_provisioning_keeps_request_on_primary(replica_app):
+    """A new key is created on the primary and the same request reads it back."""
+    client = replica_app.test_client()
+    response = client.get('/api/users/me', headers={'Api-Key': 'new-key'})
+    assert response.status_code == 200
+    assert response.json['user']['id'] == 1
+
+
+def test_no_replicas_configured(app):
+    """Without DATABASE_REPLICA_URLS there is a single engine."""
+    assert app.config['DB_REPLICAS'] == []
+
+
+def test_replica_reads_not_cached(replica_app):
+    """Tweets assembled from a possibly lagging replica are not cached."""
+    replica_app.config['TWEET_CACHE'] = True
+    seed_both(replica_app)
+    client = replica_app.test_client()
+    client.get('/api/tweets/', headers={'Api-Key': 'alice-key'})
+    assert len(replica_app.extensions['tweet_cache']) == 0
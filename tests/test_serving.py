@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+SLOW_CLIENTS = '''
+from gevent import monkey; monkey.patch_all()
+import socket, sys
+import gevent
+from gevent.pywsgi import WSGIServer
+from app.app import create_app, db
+
+app = create_app()
+app.config['UPLOAD_FOLDER'] = sys.argv[1]
+with app.app_context():
+    db.create_all()
+server = WSGIServer(('127.0.0.1', 0), app, log=None)
+server.start()
+port = server.server_port
+
+stalled = []
+for _ in range(50):
+    conn = socket.create_connection(('127.0.0.1', port))
+    conn.sendall(b'POST /api/medias/ HTTP/1.1\\r\\nHost: x\\r\\nApi-Key: slow\\r\\n'
+                 b'Content-Type: multipart/form-data; boundary=b\\r\\n'
+                 b'Content-Length: 1000000\\r\\n\\r\\n--b\\r\\n')
+    stalled.append(conn)
+gevent.sleep(0.2)
+
+conn = socket.create_connection(('127.0.0.1', port), timeout=5)
+conn.sendall(b'GET /api/tweets/ HTTP/1.1\\r\\nHost: x\\r\\nApi-Key: fast\\r\\nConnection: close\\r\\n\\r\\n')
+print(conn.recv(64).split(b'\\r\\n')[0].decode())
+'''
+
+
+def test_gevent_mode_serves_while_uploads_stall(tmp_path):
+    """Under the gevent worker fifty stalled uploads do not block a feed request."""
+    pytest.importorskip('gevent')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp_path / "serving.db"}')
+    output = subprocess.run([sys.executable, '-c', SLOW_CLIENTS, str(tmp_path / 'uploads')], env=env, check=True,
+                            capture_output=True, text=True, timeout=60).stdout
+    assert output.strip() == 'HTTP/1.1 200 OK'
@@ -0,0 +1,126 @@
+import json
+
+import pytest
+from werkzeug.test import EnvironBuilder
+
+from app.events import EventBus, LocalBroker, get_event_bus
+
+
+@pytest.fixture
+def stream(app, client):
+    app.config['EVENTS_HEARTBEAT'] = 0.01
+    app.config['EVENTS_MAX_STREAMS'] = 10
+
+    def open_stream(api_key, **headers):
+        response = client.get('/api/tweets/stream', headers={'Api-Key': api_key, **headers}, buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        chunks = (chunk.decode() for chunk in response.response)
+        assert next(chunks).startswith('retry:')
+        return chunks
+    return open_stream
+
+
+def next_event(chunks):
+    """Next event as (id, type, data), skipping heartbeats."""
+    for chunk in chunks:
+        if chunk.startswith(':'):
+            continue
+        fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+        return fields.get('id'), fields['event'], json.loads(fields['data'])
+    return None
+
+
+def test_stream_pushes_followed_users_deltas(client, stream, user_factory):
+    """Tweets, likes and deletions of followed users arrive; strangers' do not."""
+    alice, bob, carol = user_factory(), user_factory(), user_factory()
+    client.post(f'/api/users/{bob.id}/follow', headers={'Api-Key': alice.api_key})
+    chunks = stream(alice.api_key)
+
+    client.post('/api/tweets/', headers={'Api-Key': carol.api_key}, json={'tweet_data': 'stranger'})
+    tweet_id = client.post('/api/tweets/', headers={'Api-Key': bob.api_key},
+                           json={'tweet_data': 'hello'}).json['tweet_id']
+    client.post(f'/api/tweets/{tweet_id}/likes', headers={'Api-Key': carol.api_key})
+    client.delete(f'/api/tweets/{tweet_id}', headers={'Api-Key': bob.api_key})
+
+    _, kind, data = next_event(chunks)
+    assert kind == 'tweet'
+    assert data['content'] == 'hello' and data['author'] == {'id': bob.id, 'name': bob.name}
+    assert next_event(chunks)[1:] == ('like', {'tweet_id': tweet_id, 'user_id': carol.id,
+                                               'name': carol.name, 'like_count': 1})
+    assert next_event(chunks)[1:] == ('delete', {'tweet_id': tweet_id})
+
+
+def test_follow_while_streaming(client, stream, user_factory):
+    """Following someone adds their events to an open stream."""
+    alice, bob = user_factory(), user_factory()
+    chunks = stream(alice.api_key)
+    client.post(f'/api/users/{bob.id}/follow', headers={'Api-Key': alice.api_key})
+    client.post('/api/tweets/', headers={'Api-Key': bob.api_key}, json={'tweet_data': 'new follower'})
+    assert next_event(chunks)[2]['content'] == 'new follower'
+
+
+def test_resume_from_last_event_id(client, stream, user_factory):
+    """Events after Last-Event-ID are replayed; an id out of the history gets a reset."""
+    alice = user_factory()
+    for text in ('one', 'two', 'three'):
+        client.post('/api/tweets/', headers={'Api-Key': alice.api_key}, json={'tweet_data': text})
+
+    chunks = stream(alice.api_key, **{'Last-Event-ID': '1'})
+    assert [next_event(chunks)[2]['content'] for _ in range(2)] == ['two', 'three']
+
+    chunks = stream(alice.api_key, **{'Last-Event-ID': '99'})
+    assert next_event(chunks) == (None, 'reset', {})
+
+    response = client.get('/api/tweets/stream', headers={'Api-Key': alice.api_key, 'Last-Event-ID': 'x'})
+    assert response.status_code == 400
+
+
+def test_slow_consumer_is_disconnected(app, client, stream, user_factory):
+    """A stream that falls behind its buffer ends after draining it."""
+    app.config['EVENTS_CLIENT_BUFFER'] = 2
+    alice = user_factory()
+    chunks = stream(alice.api_key)
+    for text in ('one', 'two', 'three', 'four'):
+        client.post('/api/tweets/', headers={'Api-Key': alice.api_key}, json={'tweet_data': text})
+    assert [next_event(chunks)[2]['content'] for _ in range(2)] == ['one', 'two']
+    assert next_event(chunks) is None
+
+
+def test_broker_reaches_every_worker():
+    """Buses sharing a broker see the same numbered events, and old ones fall out of the history."""
+    broker = LocalBroker()
+    first, second = EventBus(history=2, broker=broker), EventBus(history=2, broker=broker)
+    subscription, complete = second.subscribe(1, [])
+    for n in range(3):
+        first.publish('tweet', 1, {'n': n})
+    assert [subscription.get(0)[0] for _ in range(3)] == [1, 2, 3]
+    assert second.subscribe(1, [], last_event_id=1)[1] is True
+    assert second.subscribe(1, [], last_event_id=0)[1] is False
+
+
+def test_streams_capped_per_worker(app, client, stream, user):
+    """Above EVENTS_MAX_STREAMS a client gets 503."""
+    app.config['EVENTS_MAX_STREAMS'] = 1
+    chunks = stream(user.api_key)
+    response = client.get('/api/tweets/stream', headers={'Api-Key': user.api_key})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '30'
+    assert next(chunks) == ': heartbeat\n\n'
+
+
+def test_streams_off_by_default(client, user):
+    response = client.get('/api/tweets/stream', headers={'Api-Key': user.api_key})
+    assert response.status_code == 404
+    assert 'Retry-After' not in response.headers
+
+
+def test_stream_closed_before_reading_frees_its_slot(app, stream, user):
+    """A client gone before the body starts does not keep its subscription."""
+    environ = EnvironBuilder('/api/tweets/stream', headers={'Api-Key': user.api_key}).get_environ()
+    body = app.wsgi_app(environ, lambda status, headers: None)
+    with app.app_context():
+        bus = get_event_bus()
+    assert len(bus) == 1
+    body.close()
+    assert len(bus) == 0
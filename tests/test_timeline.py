@@ -0,0 +1,95 @@
+import json
+
+from app.models import Follow, TimelineEntry, Tweet
+
+
+def feed_ids(client, headers):
+    response = client.get('/api/tweets/', headers=headers)
+    assert response.status_code == 200
+    return {tweet['id'] for tweet in json.loads(response.data)['tweets']}
+
+
+def test_new_tweet_is_pushed_to_followers(client, app, db, user_factory):
+    """In write mode a new tweet lands in every follower's timeline."""
+    app.config['TIMELINE_MODE'] = 'write'
+    author = user_factory()
+    follower = user_factory()
+    db.add(Follow(follower_id=follower.id, follow_on_id=author.id))
+    db.commit()
+
+    response = client.post('/api/tweets/', headers={'Api-Key': author.api_key},
+                           json={'tweet_data': 'fan out'})
+    tweet_id = json.loads(response.data)['tweet_id']
+
+    assert db.query(TimelineEntry).filter_by(user_id=follower.id, tweet_id=tweet_id).count() == 1
+    assert feed_ids(client, {'Api-Key': follower.api_key}) == {tweet_id}
+
+
+def test_follow_backfills_and_unfollow_prunes(client, app, db, user_factory):
+    """Following copies recent tweets into the timeline, unfollowing removes them."""
+    app.config['TIMELINE_MODE'] = 'write'
+    author = user_factory()
+    follower = user_factory()
+    tweet = Tweet(author_id=author.id, content='old tweet')
+    db.add(tweet)
+    db.commit()
+    headers = {'Api-Key': follower.api_key}
+
+    client.post(f'/api/users/{author.id}/follow', headers=headers)
+    assert feed_ids(client, headers) == {tweet.id}
+
+    client.delete(f'/api/users/{author.id}/follow', headers=headers)
+    assert db.query(TimelineEntry).filter_by(user_id=follower.id).count() == 0
+    assert feed_ids(client, headers) == set()
+
+
+def test_deleted_tweet_leaves_timelines(client, app, db, user_factory):
+    """Deleting a tweet removes it from materialized timelines."""
+    app.config['TIMELINE_MODE'] = 'write'
+    author = user_factory()
+    follower = user_factory()
+    db.add(Follow(follower_id=follower.id, follow_on_id=author.id))
+    db.commit()
+    response = client.post('/api/tweets/', headers={'Api-Key': author.api_key},
+                           json={'tweet_data': 'short lived'})
+    tweet_id = json.loads(response.data)['tweet_id']
+
+    response = client.delete(f'/api/tweets/{tweet_id}', headers={'Api-Key': author.api_key})
+    assert response.status_code == 204
+    assert db.query(TimelineEntry).filter_by(tweet_id=tweet_id).count() == 0
+
+
+def test_hybrid_mode_reads_big_authors_at_request_time(client, app, db, user_factory):
+    """Authors above the fan-out limit are not pushed but still show up in feeds."""
+    app.config['TIMELINE_MODE'] = 'hybrid'
+    app.config['TIMELINE_FANOUT_LIMIT'] = 1
+    celebrity = user_factory()
+    fans = [user_factory() for _ in range(2)]
+    for fan in fans:
+        client.post(f'/api/users/{celebrity.id}/follow', headers={'Api-Key': fan.api_key})
+
+    response = client.post('/api/tweets/', headers={'Api-Key': celebrity.api_key},
+                           json={'tweet_data': 'for everyone'})
+    tweet_id = json.loads(response.data)['tweet_id']
+
+    assert db.query(TimelineEntry).filter_by(tweet_id=tweet_id).count() == 0
+    for fan in fans:
+        assert feed_ids(client, {'Api-Key': fan.api_key}) == {tweet_id}
+
+
+def test_hybrid_author_dropping_below_limit_stays_in_feeds(client, app, db, user_factory):
+    """Tweets posted above the fan-out limit are pushed once the author drops back to it."""
+    app.config['TIMELINE_MODE'] = 'hybrid'
+    app.config['TIMELINE_FANOUT_LIMIT'] = 1
+    celebrity = user_factory()
+    fans = [user_factory() for _ in range(2)]
+    for fan in fans:
+        client.post(f'/api/users/{celebrity.id}/follow', headers={'Api-Key': fan.api_key})
+    response = client.post('/api/tweets/', headers={'Api-Key': celebrity.api_key},
+                           json={'tweet_data': 'while famous'})
+    tweet_id = json.loads(response.data)['tweet_id']
+
+    client.delete(f'/api/users/{celebrity.id}/follow', headers={'Api-Key': fans[0].api_key})
+    assert db.query(TimelineEntry).filter_by(tweet_id=tweet_id).count() == 1
+    assert feed_ids(client, {'Api-Key': fans[1].api_key}) == {tweet_id}
+    assert feed_ids(client, {'Api-Key': fans[0].api_key}) == set()
@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import event
+
+from app.app import db as _db
+from app.cache import TweetCache
+from app.events import LocalBroker
+
+
+def count_statements(app, client, path, headers, table):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if f'FROM {table}' in statement:
+            statements.append(statement)
+
+    with app.app_context():
+        engine = _db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(path, headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response, len(statements)
+
+
+@pytest.fixture(autouse=True)
+def tweet_cache(app):
+    app.config['TWEET_CACHE'] = True
+
+
+def test_cache_off_by_default(client, auth_headers, tweet):
+    """Without a shared channel or TWEET_CACHE nothing is cached."""
+    app = client.application
+    app.config['TWEET_CACHE'] = False
+    client.get('/api/tweets/', headers=auth_headers)
+    assert 'tweet_cache' not in app.extensions
+
+
+def test_hot_tweets_served_from_cache(app, client, auth_headers, like_factory, tweet):
+    """A repeated feed read does not load likes again until a like changes them."""
+    like_factory(tweet=tweet)
+    first, _ = count_statements(app, client, '/api/tweets/', auth_headers, 'likes')
+    second, queries = count_statements(app, client, '/api/tweets/', auth_headers, 'likes')
+    assert queries == 0
+    assert second.json == first.json
+
+    client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    third, queries = count_statements(app, client, '/api/tweets/', auth_headers, 'likes')
+    assert queries == 1
+    assert len(third.json['tweets'][0]['likes']) == 2
+
+
+def test_new_tweet_cached_on_post(app, client, auth_headers, user):
+    """A posted tweet is in the cache before anyone reads it."""
+    client.post('/api/tweets/', headers=auth_headers, json={'tweet_data': 'fresh'})
+    response, queries = count_statements(app, client, '/api/tweets/', auth_headers, 'likes')
+    assert queries == 0
+    assert response.json['tweets'][0]['content'] == 'fresh'
+
+
+def test_invalidation_reaches_every_worker():
+    """Caches sharing a channel all drop an invalidated tweet."""
+    channel = LocalBroker()
+    first, second = TweetCache(10000, 60, channel), TweetCache(10000, 60, channel)
+    for cache in (first, second):
+        cache.set(1, {'id': 1})
+    first.invalidate(1)
+    assert first.get_many([1]) == {} and second.get_many([1]) == {}
+
+
+def test_stale_read_not_stored():
+    """A reader that started before an invalidation does not store its result."""
+    cache = TweetCache(10000, 60)
+    generation = cache.generation
+    cache.invalidate(1)
+    cache.set_many({1: {'id': 1, 'likes': []}, 2: {'id': 2}}, generation)
+    assert list(cache.get_many([1, 2])) == [2]
+
+
+def test_memory_bound_evicts_least_recently_used():
+    """Entries beyond max_bytes push out the least recently used ones."""
+    cache = TweetCache(60, 60)
+    for tweet_id in (1, 2, 3):
+        cache.set(tweet_id, {'id': tweet_id, 'content': 'x'})
+        cache.get_many([1])
+    assert sorted(cache.get_many([1, 2, 3])) == [1, 3]
+    assert cache.size <= 60
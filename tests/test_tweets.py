@@ -1,5 +1,11 @@
 import json
 
+from sqlalchemy import event
+
+from app.app import db as _db
+from app.models import Tweet, Like, Attachment, Follow, FeedChange
+from app.sync import record_change
+
 
 def test_get_tweets_unauthorized(client):
     """Test getting tweets without API key."""
@@ -100,4 +106,220 @@ def test_unlike_tweet_success(client, auth_headers, tweet, like_factory):
     )
     assert response.status_code == 200
     data = json.loads(response.data)
-    assert data['result'] is True
\ No newline at end of file
+    assert data['result'] is True
+
+def test_get_tweets_query_count_does_not_grow(client, auth_headers, app, db, user_factory):
+    """Feed assembly runs a fixed number of queries regardless of feed size."""
+    author = user_factory(api_key='test-api-key')
+    likers = [user_factory() for _ in range(10)]
+    for i in range(30):
+        tweet = Tweet(author_id=author.id, content=f'tweet {i}')
+        db.add(tweet)
+        db.flush()
+        db.add(Attachment(tweet_id=tweet.id, url=f'uploads/{i}.png', src=f'{i}.png'))
+        for liker in likers:
+            db.add(Like(tweet_id=tweet.id, user_id=liker.id))
+    db.commit()
+
+    statements = []
+
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = _db.engine
+    event.listen(engine, 'before_cursor_execute', count_query)
+    try:
+        response = client.get('/api/tweets/?limit=50', headers=auth_headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_query)
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert len(data['tweets']) == 30
+    assert all(len(tweet['likes']) == 10 for tweet in data['tweets'])
+    assert all(len(tweet['attachments']) == 1 for tweet in data['tweets'])
+    assert len(statements) <= 5
+
+
+def test_get_tweets_only_followed_authors(client, auth_headers, db, user_factory):
+    """Feed contains the caller's and followed users' tweets only."""
+    me = user_factory(api_key='test-api-key')
+    followed = user_factory()
+    stranger = user_factory()
+    db.add(Follow(follower_id=me.id, follow_on_id=followed.id))
+    for author in (me, followed, stranger):
+        db.add(Tweet(author_id=author.id, content=f'by {author.name}'))
+    db.commit()
+
+    response = client.get('/api/tweets/', headers=auth_headers)
+    assert response.status_code == 200
+    authors = {tweet['author']['id'] for tweet in json.loads(response.data)['tweets']}
+    assert authors == {me.id, followed.id}
+
+
+def test_get_tweets_sorted_by_likes_and_paginated(client, auth_headers, db, user_factory):
+    """Feed is ranked by like count and pages through a cursor without gaps."""
+    me = user_factory(api_key='test-api-key')
+    likers = [user_factory() for _ in range(4)]
+    tweets = []
+    for likes in (1, 3, 0, 3, 2):
+        tweet = Tweet(author_id=me.id, content=f'{likes} likes', like_count=likes)
+        db.add(tweet)
+        db.flush()
+        for liker in likers[:likes]:
+            db.add(Like(tweet_id=tweet.id, user_id=liker.id))
+        tweets.append(tweet)
+    db.commit()
+    expected = [tweets[3].id, tweets[1].id, tweets[4].id, tweets[0].id, tweets[2].id]
+
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/tweets/?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        data = json.loads(client.get(url, headers=auth_headers).data)
+        assert len(data['tweets']) <= 2
+        seen.extend(tweet['id'] for tweet in data['tweets'])
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_get_tweets_invalid_cursor(client, auth_headers):
+    """Malformed cursor is rejected."""
+    response = client.get('/api/tweets/?cursor=garbage', headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_like_and_unlike_update_like_count(client, auth_headers, tweet, db):
+    """Liking and unliking keep Tweet.like_count in step."""
+    client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    db.refresh(tweet)
+    assert tweet.like_count == 1
+
+    client.delete(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+    db.refresh(tweet)
+    assert tweet.like_count == 0
+
+
+def test_recount_fixes_drift(app, db, tweet, user_factory):
+    """'flask recount' restores counters that drifted from the rows."""
+    liker = user_factory()
+    db.add(Like(tweet_id=tweet.id, user_id=liker.id))
+    db.add(Follow(follower_id=liker.id, follow_on_id=tweet.author_id))
+    tweet.like_count = 7
+    db.commit()
+
+    result = app.test_cli_runner().invoke(args=['recount', '--batch-size', '1'])
+    assert result.exit_code == 0
+
+    db.expire_all()
+    assert tweet.like_count == 1
+    assert liker.following_count == 1
+    assert tweet.author.followers_count == 1
+
+
+def test_feed_etag_answers_304_until_it_changes(client, user_factory):
+    """A repeated poll gets 304; a like on a followed user's tweet changes the ETag."""
+    reader, author, liker = user_factory(), user_factory(), user_factory()
+    client.post(f'/api/users/{author.id}/follow', headers={'Api-Key': reader.api_key})
+    tweet_id = client.post('/api/tweets/', headers={'Api-Key': author.api_key},
+                           json={'tweet_data': 'hi'}).json['tweet_id']
+    headers = {'Api-Key': reader.api_key}
+
+    first = client.get('/api/tweets/', headers=headers)
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+    again = client.get('/api/tweets/', headers={**headers, 'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag
+
+    client.post(f'/api/tweets/{tweet_id}/likes', headers={'Api-Key': liker.api_key})
+    changed = client.get('/api/tweets/', headers={**headers, 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_feed_since_id_returns_changes_only(client, user_factory):
+    """since_id returns new and re-liked tweets and the ids of deleted ones."""
+    reader, author = user_factory(), user_factory()
+    client.post(f'/api/users/{author.id}/follow', headers={'Api-Key': reader.api_key})
+    post = lambda text: client.post('/api/tweets/', headers={'Api-Key': author.api_key},
+                                    json={'tweet_data': text}).json['tweet_id']
+    post('old')
+    liked, doomed = post('liked'), post('doomed')
+    since_id = client.get('/api/tweets/', headers={'Api-Key': reader.api_key}).json['since_id']
+
+    new = post('new')
+    client.post(f'/api/tweets/{liked}/likes', headers={'Api-Key': reader.api_key})
+    client.delete(f'/api/tweets/{doomed}', headers={'Api-Key': author.api_key})
+
+    data = client.get(f'/api/tweets/?since_id={since_id}', headers={'Api-Key': reader.api_key}).json
+    assert [tweet['id'] for tweet in data['tweets']] == [liked, new]
+    assert data['tweets'][0]['likes'] == [{'user_id': reader.id, 'name': reader.name}]
+    assert data['deleted'] == [doomed]
+    assert data['since_id'] > since_id
+
+    data = client.get(f'/api/tweets/?since_id={data["since_id"]}', headers={'Api-Key': reader.api_key}).json
+    assert data['tweets'] == [] and data['deleted'] == []
+
+
+def test_feed_since_id_expired(app, client, user_factory):
+    """A since_id older than the kept changes, or not handed out yet, gets 410."""
+    author = user_factory()
+    for text in ('a', 'b', 'c'):
+        client.post('/api/tweets/', headers={'Api-Key': author.api_key}, json={'tweet_data': text})
+    assert app.test_cli_runner().invoke(args=['prune-changes', '--keep', '1']).exit_code == 0
+    response = client.get('/api/tweets/?since_id=1', headers={'Api-Key': author.api_key})
+    assert response.status_code == 410
+    response = client.get('/api/tweets/?since_id=1000000', headers={'Api-Key': author.api_key})
+    assert response.status_code == 410
+
+
+def test_feed_changes_inserted_on_commit(db, tweet):
+    """Changes are written by the commit, and a rollback drops them."""
+    record_change('like', tweet.author_id, tweet.id)
+    assert db.query(FeedChange).count() == 0
+    db.rollback()
+    db.commit()
+    assert db.query(FeedChange).count() == 0
+    record_change('like', tweet.author_id, tweet.id)
+    db.commit()
+    assert db.query(FeedChange).count() == 1
+
+
+def test_fast_serialization_matches_marshal(app, client, auth_headers, like_factory, tweet):
+    """Feed responses are the same with and without FAST_SERIALIZATION."""
+    like_factory(tweet=tweet)
+    fast = client.get('/api/tweets/', headers=auth_headers).json
+    app.config['FAST_SERIALIZATION'] = False
+    assert client.get('/api/tweets/', headers=auth_headers).json == fast
+
+
+def test_repeated_like_is_a_noop(client, auth_headers, tweet, db):
+    """Liking twice answers the same state instead of failing on like_uc."""
+    for _ in range(2):
+        response = client.post(f'/api/tweets/{tweet.id}/likes', headers=auth_headers)
+        assert response.status_code == 201
+        assert response.json['like_count'] == 1
+    assert db.query(Like).count() == 1
+
+
+def test_like_unknown_tweet(client, auth_headers, db):
+    assert client.post('/api/tweets/999/likes', headers=auth_headers).status_code == 404
+    assert db.query(Like).count() == 0
+
+
+def test_like_batch(client, auth_headers, db, tweet_factory, user_factory):
+    author = user_factory()
+    tweets = [tweet_factory(author=author) for _ in range(3)]
+    client.post(f'/api/tweets/{tweets[0].id}/likes', headers=auth_headers)
+    response = client.post('/api/tweets/likes:batch', headers=auth_headers,
+                           json={'tweet_ids': [t.id for t in tweets] + [999]})
+    assert response.status_code == 201
+    assert response.json['likes'] == [{'tweet_id': t.id, 'like_count': 1} for t in tweets]
+    assert response.json['not_found'] == [999]
+    assert db.query(Like).count() == 3
+    assert client.post('/api/tweets/likes:batch', headers=auth_headers,
+                       json={'tweet_ids': 'all'}).status_code == 400
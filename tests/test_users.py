@@ -1,4 +1,7 @@
 import json
+import threading
+
+from app.models import Follow, User
 
 
 def test_get_user_profile_me_unauthorized(client):
@@ -59,3 +62,128 @@ def test_unfollow_user_success(client, auth_headers, user, second_user, follow_f
         headers=auth_headers
     )
     assert response.status_code == 204
+
+
+def test_follow_updates_counters(client, auth_headers, user, second_user):
+    """Follow and unfollow keep followers_count and following_count in step."""
+    client.post(f'/api/users/{second_user.id}/follow', headers=auth_headers)
+    data = json.loads(client.get(f'/api/users/{second_user.id}').data)
+    assert data['user']['followers_count'] == 1
+    me = json.loads(client.get('/api/users/me', headers=auth_headers).data)
+    assert me['user']['following_count'] == 1
+
+    client.delete(f'/api/users/{second_user.id}/follow', headers=auth_headers)
+    client.delete(f'/api/users/{second_user.id}/follow', headers=auth_headers)
+    data = json.loads(client.get(f'/api/users/{second_user.id}').data)
+    assert data['user']['followers_count'] == 0
+    me = json.loads(client.get('/api/users/me', headers=auth_headers).data)
+    assert me['user']['following_count'] == 0
+
+
+def test_concurrent_first_requests_create_one_user(app, db):
+    """Simultaneous first requests with one new key provision a single user."""
+    workers = 16
+    barrier = threading.Barrier(workers)
+    results = []
+
+    def first_request():
+        client = app.test_client()
+        barrier.wait()
+        response = client.get('/api/users/me', headers={'Api-Key': 'brand-new-key'})
+        results.append((response.status_code, json.loads(response.data)['user']['id']))
+
+    threads = [threading.Thread(target=first_request) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [status for status, _ in results] == [200] * workers
+    assert len({user_id for _, user_id in results}) == 1
+    user = db.query(User).filter_by(api_key='brand-new-key').one()
+    assert user.name == f'User@{user.id}'
+
+
+def test_profile_lists_followers_and_following(client, db, user_factory):
+    """Profile shows who follows the user and whom the user follows."""
+    user, fan, idol = user_factory(), user_factory(), user_factory()
+    db.add(Follow(follower_id=fan.id, follow_on_id=user.id))
+    db.add(Follow(follower_id=user.id, follow_on_id=idol.id))
+    db.commit()
+
+    data = json.loads(client.get(f'/api/users/{user.id}').data)['user']
+    assert data['followers'] == [{'id': fan.id, 'name': fan.name}]
+    assert data['following'] == [{'id': idol.id, 'name': idol.name}]
+    assert data['followers_next_cursor'] is None
+
+
+def test_followers_endpoint_paginates(client, db, user_factory):
+    """Followers are listed page by page, newest first."""
+    user = user_factory()
+    fans = [user_factory() for _ in range(5)]
+    for fan in fans:
+        db.add(Follow(follower_id=fan.id, follow_on_id=user.id))
+    db.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        url = f'/api/users/{user.id}/followers?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        data = json.loads(client.get(url).data)
+        assert len(data['users']) <= 2
+        seen.extend(item['id'] for item in data['users'])
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [fan.id for fan in reversed(fans)]
+
+    data = json.loads(client.get(f'/api/users/{fans[0].id}/following').data)
+    assert data['users'] == [{'id': user.id, 'name': user.name}]
+
+
+def test_followers_endpoint_not_found(client):
+    """Follower list of an unknown user is a 404."""
+    assert client.get('/api/users/999/followers').status_code == 404
+
+
+def test_profile_etag_changes_on_follow(client, user, second_user):
+    """Profile responses carry an ETag that a new follower invalidates."""
+    etag = client.get(f'/api/users/{second_user.id}').headers['ETag']
+    assert client.get(f'/api/users/{second_user.id}', headers={'If-None-Match': etag}).status_code == 304
+    followers = client.get(f'/api/users/{second_user.id}/followers')
+    assert client.get(f'/api/users/{second_user.id}/followers',
+                      headers={'If-None-Match': followers.headers['ETag']}).status_code == 304
+
+    client.post(f'/api/users/{second_user.id}/follow', headers={'Api-Key': user.api_key})
+    assert client.get(f'/api/users/{second_user.id}', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get(f'/api/users/{second_user.id}/followers',
+                      headers={'If-None-Match': followers.headers['ETag']}).status_code == 200
+
+
+def test_repeated_follow_is_a_noop(client, auth_headers, user, second_user):
+    """Following twice answers the same state instead of failing on follow_uc."""
+    for _ in range(2):
+        response = client.post(f'/api/users/{second_user.id}/follow', headers=auth_headers)
+        assert response.status_code == 201
+        assert response.json['followers_count'] == 1
+    me = json.loads(client.get('/api/users/me', headers=auth_headers).data)
+    assert me['user']['following_count'] == 1
+
+
+def test_follow_unknown_user(client, auth_headers):
+    assert client.post('/api/users/999/follow', headers=auth_headers).status_code == 404
+
+
+def test_follow_batch(client, auth_headers, user, user_factory):
+    users = [user_factory() for _ in range(3)]
+    client.post(f'/api/users/{users[0].id}/follow', headers=auth_headers)
+    response = client.post('/api/users/follow:batch', headers=auth_headers,
+                           json={'user_ids': [u.id for u in users] + [999, users[1].id]})
+    assert response.status_code == 201
+    assert response.json['follows'] == [{'user_id': u.id, 'followers_count': 1} for u in users]
+    assert response.json['not_found'] == [999]
+    me = json.loads(client.get('/api/users/me', headers=auth_headers).data)
+    assert me['user']['following_count'] == 3
+
+    for body in ({}, {'user_ids': []}, {'user_ids': ['1']}, {'user_ids': list(range(101))}):
+        assert client.post('/api/users/follow:batch', headers=auth_headers, json=body).status_code == 400